@@ -1,19 +1,1012 @@
 #!/usr/bin/env python3
-import genanki
 import random
 import argparse
 import re
 import html
+import sys
+import os
+import time
+import functools
+import hashlib
+import io
+import itertools
+import json
+from array import array
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+# genanki, sqlite3, zipfile and the process pool are imported where they are
+# used, so --help and --check runs do not pay for them at startup.
+
+MODEL_NAME = 'AllInOne (kprim, mc, sc)'
+
+
+# Card markup shared by both sides; the options are rendered by CARD_SCRIPT
+_CARD_HTML = '''
+                    <div class="question">{{Question}}</div>
+                    <div id="%(container)s">
+                        <!-- %(comment)s -->
+                    </div>
+                    <div id="selected-option" style="display:none;">{{selected-option}}</div>
+                    <div id="answers" style="display:none;">{{Answers}}</div>
+                    <div id="shuffle-order" style="display:none;">{{ShuffleOrder}}</div>
+                    
+                    <!-- Hidden option data -->
+                    <div style="display:none;" id="option-data">
+                        {{#Q_1}}<div data-index="0">{{Q_1}}</div>{{/Q_1}}
+                        {{#Q_2}}<div data-index="1">{{Q_2}}</div>{{/Q_2}}
+                        {{#Q_3}}<div data-index="2">{{Q_3}}</div>{{/Q_3}}
+                        {{#Q_4}}<div data-index="3">{{Q_4}}</div>{{/Q_4}}
+                    </div>
+                    '''
+FRONT_HTML = _CARD_HTML % {'container': 'options-container',
+                           'comment': 'Options will be dynamically generated and shuffled'}
+BACK_HTML = _CARD_HTML % {'container': 'options-container-back',
+                          'comment': 'Options will be displayed with answer highlighting'}
+
+# Behaviour of both card sides: shuffling, selection, feedback and answer
+# highlighting. Either inlined into each template or shipped once as a media
+# file (see card_script_name).
+CARD_SCRIPT = '''
+var mcqCard = (function () {
+    // Create a unique identifier for this card based on its content
+    function getCardId() {
+        const question = document.querySelector('.question').textContent.trim();
+        const optionData = document.getElementById('option-data');
+        const options = Array.from(optionData.children).map(el => el.textContent.trim()).join('|');
+        // btoa only takes Latin-1, so encode as UTF-8 first
+        const text = unescape(encodeURIComponent(question + '|||' + options));
+        return btoa(text).substring(0, 20); // Base64 encoded, shortened
+    }
+
+    // Simple random shuffle function
+    function shuffleArray(array) {
+        const shuffled = [...array];
+        for (let i = shuffled.length - 1; i > 0; i--) {
+            const j = Math.floor(Math.random() * (i + 1));
+            [shuffled[i], shuffled[j]] = [shuffled[j], shuffled[i]];
+        }
+        return shuffled;
+    }
+
+    // This card's non-empty options in their original order
+    function originalOrder() {
+        const optionData = document.getElementById('option-data');
+        const options = Array.from(optionData.children).filter(el => el.textContent.trim() !== '');
+        return options.map(el => ({
+            text: el.textContent.trim(),
+            originalIndex: parseInt(el.getAttribute('data-index'))
+        }));
+    }
+
+    // Get the card's shuffle order. The front side creates it ONLY ONCE per
+    // card; the back side reuses it and falls back to the original order.
+    function getShuffleOrder(create) {
+        const sessionKey = 'cardShuffle_' + getCardId();
+
+        // Check if we have a session shuffle order for this specific card
+        if (window[sessionKey]) {
+            return window[sessionKey];
+        }
+
+        // Check if we have a stored shuffle order in the hidden field
+        const shuffleOrderEl = document.getElementById('shuffle-order');
+        const storedOrder = shuffleOrderEl.textContent.trim();
+
+        if (storedOrder && storedOrder !== '{{ShuffleOrder}}' && storedOrder !== '') {
+            try {
+                const parsed = JSON.parse(storedOrder);
+                window[sessionKey] = parsed; // Store in session
+                return parsed;
+            } catch (e) {
+                // If parsing fails, fall through
+            }
+        }
+
+        const options = originalOrder();
+        if (!create || options.length === 0) return options;
+
+        // Create shuffle order and store it in both session and hidden field
+        const shuffledOrder = shuffleArray(options);
+        window[sessionKey] = shuffledOrder;
+        shuffleOrderEl.textContent = JSON.stringify(shuffledOrder);
+        return shuffledOrder;
+    }
+
+    function checkAnswer(index) {
+        var answers = document.getElementById('answers').textContent.trim().split(" ");
+        return answers[index] === "1";
+    }
+
+    // Show a feedback message for `duration` ms (2 s on the front, 4 s on the back)
+    function showFeedback(isCorrect, duration, animate) {
+        // Remove existing feedback
+        document.querySelectorAll('.answer-feedback').forEach(el => el.remove());
+
+        var feedbackDiv = document.createElement('div');
+        feedbackDiv.className = 'answer-feedback';
+        feedbackDiv.textContent = isCorrect ? '✓ Correct!' : '✗ Incorrect';
+        feedbackDiv.style.backgroundColor = isCorrect ? '#4CAF50' : '#f44336';
+        feedbackDiv.style.color = 'white';
+        feedbackDiv.style.position = 'fixed';
+        feedbackDiv.style.bottom = '20px';
+        feedbackDiv.style.left = '50%';
+        feedbackDiv.style.transform = 'translateX(-50%)';
+        feedbackDiv.style.padding = '12px 24px';
+        feedbackDiv.style.borderRadius = '8px';
+        feedbackDiv.style.fontWeight = 'bold';
+        feedbackDiv.style.zIndex = '1000';
+        if (animate) feedbackDiv.style.animation = 'fadeIn 0.3s ease';
+        document.body.appendChild(feedbackDiv);
+
+        setTimeout(function() {
+            feedbackDiv.remove();
+        }, duration);
+    }
+
+    // Render options as "A) text" rows; optionClass picks each row's classes
+    function renderOptions(container, order, optionClass, onSelect) {
+        container.innerHTML = '';
+        order.forEach((option, i) => {
+            const wrapper = document.createElement('div');
+            wrapper.className = optionClass(option);
+            wrapper.setAttribute('data-index', option.originalIndex);
+            if (onSelect) wrapper.onclick = function() { onSelect(option.originalIndex); };
+
+            const optionDiv = document.createElement('div');
+            optionDiv.className = 'option';
+            optionDiv.textContent = String.fromCharCode(65 + i) + ') ' + option.text;
+
+            wrapper.appendChild(optionDiv);
+            container.appendChild(wrapper);
+        });
+    }
+
+    function selectOption(index) {
+        // Prevent multiple selections
+        var allOptions = document.querySelectorAll('.option-wrapper');
+        var alreadyAnswered = Array.from(allOptions).some(opt =>
+            opt.className.includes('selected-') || opt.className.includes('correct'));
+
+        if (alreadyAnswered) return; // Don't allow re-selection
+
+        // Clear all option styles first
+        allOptions.forEach(opt => opt.className = 'option-wrapper disabled');
+
+        var selected = document.querySelector('.option-wrapper[data-index="' + index + '"]');
+        if (!selected) return;
+
+        var isCorrect = checkAnswer(index);
+        selected.className = 'option-wrapper ' + (isCorrect ? 'selected-correct' : 'selected-incorrect');
+        showFeedback(isCorrect, 2000, false);
+
+        // Always show the correct answer(s) for learning
+        var answers = document.getElementById('answers').textContent.trim().split(" ");
+        answers.forEach((ans, i) => {
+            if (ans === "1") {
+                var correct = document.querySelector('.option-wrapper[data-index="' + i + '"]');
+                if (correct && !correct.className.includes('selected-')) {
+                    correct.className = 'option-wrapper correct disabled';
+                }
+            }
+        });
+
+        // Store selection
+        var hidden = document.getElementById('selected-option');
+        if (hidden) hidden.textContent = index;
+
+        // Disable clicking on all options
+        allOptions.forEach(opt => {
+            opt.onclick = null;
+            opt.style.cursor = 'default';
+        });
+
+        // Show native Anki review buttons by triggering answer state
+        setTimeout(function() {
+            if (typeof pycmd !== 'undefined') {
+                pycmd('ans');
+            }
+        }, 2000); // Give time to see the feedback
+    }
+
+    function initFront() {
+        const shuffledOptions = getShuffleOrder(true);
+        if (shuffledOptions.length === 0) return;
+        renderOptions(document.getElementById('options-container'), shuffledOptions,
+                      () => 'option-wrapper', selectOption);
+    }
+
+    // Back side: same shuffle order and selection state as the front side
+    function initBack() {
+        const shuffleOrder = getShuffleOrder(false);
+        if (shuffleOrder.length === 0) return;
+
+        const selected = document.getElementById('selected-option').textContent.trim();
+        const selectedIndex = selected !== '' && selected !== '{{selected-option}}' ? parseInt(selected) : -1;
+
+        renderOptions(document.getElementById('options-container-back'), shuffleOrder, option => {
+            const isCorrect = checkAnswer(option.originalIndex);
+            if (option.originalIndex === selectedIndex) {
+                return 'option-wrapper ' + (isCorrect ? 'selected-correct' : 'selected-incorrect') + ' disabled';
+            }
+            // Always show correct answers highlighted for learning
+            return isCorrect ? 'option-wrapper correct disabled' : 'option-wrapper disabled';
+        });
+
+        // Show the same feedback message on back side if user made a selection
+        if (selectedIndex !== -1) {
+            showFeedback(checkAnswer(selectedIndex), 4000, true);
+        }
+    }
+
+    // Initialize when page loads
+    function whenReady(init) {
+        document.addEventListener('DOMContentLoaded', init);
+        if (document.readyState !== 'loading') {
+            init();
+        }
+    }
+
+    return {initFront: initFront, initBack: initBack, whenReady: whenReady};
+})();
+'''
+
+
+def card_script_name():
+    """Versioned media file name for the external card script.
+
+    The name changes with the script's content, so Anki never serves a stale
+    cached copy. The leading underscore keeps Anki's media check from
+    deleting it as unused.
+    """
+    return f"_mcq_card_{hashlib.sha1(CARD_SCRIPT.encode('utf-8')).hexdigest()[:8]}.js"
+
+
+def card_templates(external_script=False):
+    """Return (qfmt, afmt) for the MCQ model.
+
+    By default the card script is inlined into both templates. With
+    external_script=True both templates load it from the media file named
+    by card_script_name(); the webview keeps it after the first card, so it
+    is parsed once per session instead of on every render.
+    """
+    if not external_script:
+        def inline(init):
+            return f"<script>{CARD_SCRIPT}mcqCard.whenReady(mcqCard.{init});\n</script>\n"
+        return FRONT_HTML + inline('initFront'), BACK_HTML + inline('initBack')
+
+    # Anki does not reliably wait for <script src> before running later inline
+    # scripts, so load the file once and run the side's init when it is ready
+    loader = '''<script>
+                    (function () {
+                        var file = '%s';
+                        function run() { mcqCard.whenReady(mcqCard.%%s); }
+                        if (window.mcqCard && window.mcqCardFile === file) { run(); return; }
+                        var script = document.createElement('script');
+                        script.src = file;
+                        script.onload = function () { window.mcqCardFile = file; run(); };
+                        document.body.appendChild(script);
+                    })();
+                    </script>
+''' % card_script_name()
+    return FRONT_HTML + loader % 'initFront', BACK_HTML + loader % 'initBack'
+
+
+# Compact parsed MCQ; namedtuples carry no per-instance __dict__
+MCQRecord = namedtuple('MCQRecord', ['question', 'options', 'answers'])
+
+# Only the first 4 options are kept, so there are only 4 possible answer strings
+_ANSWER_STRINGS = ('1 0 0 0', '0 1 0 0', '0 0 1 0', '0 0 0 1')
+
+
+def parse_mcq_record(line, _new=tuple.__new__, _record=MCQRecord):
+    """Fast-path equivalent of MCQConverter.parse_mcq_line returning an MCQRecord.
+
+    Splits once at C level, strips each part once, finds the correct option
+    with list.index and picks a precomputed answers string. Returns None for
+    the same lines parse_mcq_line rejects.
+    """
+    question_part, sep, correct_answer = line.partition('\t')
+    if not sep or '\t' in correct_answer:
+        return None
+    parts = [p for p in map(str.strip, question_part.split('<br>')) if p]
+    if len(parts) < 5:  # Need at least question + 4 options
+        return None
+    options = parts[1:5]
+    try:
+        correct_index = options.index(correct_answer.strip())
+    except ValueError:
+        correct_index = 0  # Same silent fallback as parse_mcq_line
+    # tuple.__new__ skips the namedtuple's Python-level __new__
+    return _new(_record, (parts[0], options, _ANSWER_STRINGS[correct_index]))
+
+
+# README-style quiz text: "Q1: question", "A) option", "C) **correct**" or "Answer: C"
+_QUIZ_QUESTION_RE = re.compile(r'^(?:Q\s*\d*|\d+)\s*[.:)]\s*(.*)$', re.IGNORECASE)
+_QUIZ_OPTION_RE = re.compile(r'^\(?([A-Ea-e])\s*[.)]\s*(.*)$')
+_QUIZ_ANSWER_RE = re.compile(r'^(?:answer|ans|correct)\s*[:.\-]?\s*\(?([A-Ea-e])\)?$', re.IGNORECASE)
+_QUIZ_MARKER_RE = re.compile(r'^\*\*(.*)\*\*$')
+
+
+def _quiz_record(question, options, correct_index):
+    if question is None or len(options) < 4:  # Same minimum as parse_mcq_line
+        return None
+    # Markers that did not wrap a whole option are just bold words (e.g. "**not**")
+    options = [' '.join(parts).replace('**', '') for parts in options[:4]]
+    if correct_index is None or correct_index >= 4:
+        correct_index = 0
+    return MCQRecord(' '.join(question).replace('**', ''), options, _ANSWER_STRINGS[correct_index])
+
+
+def parse_quiz_blocks(lines):
+    """Yield MCQRecords from quiz text in the format described in the README.
+
+    Questions start with "Q1:" or "1.", options with "A)" or "(a)", in
+    order. The correct option is either wrapped in ** (its text or the
+    whole line) or named on an "Answer: C" line.
+    Lines that match neither, including option-like lines with an
+    out-of-order letter, continue the previous question or option, so
+    wrapped text (e.g. from OCR) is joined back together.
+    """
+    question, options, correct = None, [], None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # A whole line in ** (e.g. a bold paragraph) only matters for options
+        bold = _QUIZ_MARKER_RE.match(line)
+        if bold:
+            line = bold.group(1).strip()
+        match = _QUIZ_QUESTION_RE.match(line)
+        if match:
+            record = _quiz_record(question, options, correct)
+            if record:
+                yield record
+            question, options, correct = [match.group(1)], [], None
+            continue
+        if question is None:
+            continue
+        match = _QUIZ_ANSWER_RE.match(line)
+        if match:
+            correct = ord(match.group(1).upper()) - ord('A')
+            continue
+        match = _QUIZ_OPTION_RE.match(line)
+        # Only the next letter starts an option; "e.g. ..." wrapped onto its own line does not
+        if match and match.group(1).upper() == chr(ord('A') + len(options)):
+            text = match.group(2).strip()
+            marked = _QUIZ_MARKER_RE.match(text)
+            if marked:
+                text = marked.group(1).strip()
+            if marked or bold:
+                correct = len(options)
+            options.append([text])
+            continue
+        (options[-1] if options else question).append(line)
+    record = _quiz_record(question, options, correct)
+    if record:
+        yield record
+
+
+def reject_reason(line):
+    """Say why parse_mcq_record rejected a line: 'tab_count' or 'too_few_options'."""
+    return 'tab_count' if line.count('\t') != 1 else 'too_few_options'
+
+
+def answer_matched(line, mcq):
+    """Return False if a parsed line's correct answer matched none of its options."""
+    return line.partition('\t')[2].strip() in mcq.options
+
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_LETTER_KEY_RE = re.compile(r'\(?([a-d])[).:]?')
+
+
+def normalize_answer(text):
+    """Canonical form of an option or answer key for matching.
+
+    Decodes HTML entities, drops tags, collapses whitespace (including
+    non-breaking spaces), case-folds and removes trailing punctuation.
+    """
+    return ' '.join(_TAG_RE.sub(' ', html.unescape(text)).split()).casefold().rstrip('.;,')
+
+
+class AnswerResolver:
+    """Resolve answer keys that match none of the options exactly.
+
+    parse_mcq_record marks the first option when the answer column is not
+    exactly one of the options. Callers pass only those rows to resolve(),
+    so rows that match exactly never leave the parsing fast path. Each
+    distinct string is normalized (see normalize_answer) once per batch of
+    BATCH_SIZE resolved rows, and the resolver picks, in order: the option
+    equal to the answer after normalization, the option named by a letter
+    key such as "C" or "c)", or the most similar option by bigram
+    similarity. Matches scoring under `min_confidence`, or within
+    `min_margin` of the runner-up, are kept in `low_confidence`; under
+    `min_ratio` the row keeps the first option. `row_offset` is added to
+    the row numbers in the report, e.g. the START of --rows.
+    """
+
+    BATCH_SIZE = 4096
+    METHODS = ('normalized', 'letter', 'fuzzy', 'unresolved')
+
+    def __init__(self, min_confidence=0.85, min_margin=0.1, min_ratio=0.5, row_offset=0):
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.min_ratio = min_ratio
+        self.row_offset = row_offset
+        self.counts = dict.fromkeys(self.METHODS, 0)
+        self.low_confidence = []
+        self._normalized, self._bigrams, self._pending = {}, {}, 0
+
+    def resolve(self, row, line, mcq, stats=None):
+        """Return the MCQRecord of a row parsed with the first-option fallback, fixing its answer.
+
+        `row` is the 0-based content row number (as used by --rows) that
+        identifies the row in the low-confidence report. Rows whose answer
+        does match the first option are returned unchanged.
+        """
+        answer = line.partition('\t')[2].strip()
+        if answer in mcq.options:
+            return mcq
+        if self._pending >= self.BATCH_SIZE:
+            # Bound the per-batch caches
+            self._normalized.clear()
+            self._bigrams.clear()
+            self._pending = 0
+        self._pending += 1
+        normalized = self._normalized
+        for text in (answer, *mcq.options):
+            if text not in normalized:
+                normalized[text] = normalize_answer(text)
+        index, method, score, margin = self._match(
+            normalized[answer], [normalized[option] for option in mcq.options], self._bigrams)
+        self.counts[method] += 1
+        if stats is not None:
+            stats.count('answer_' + method)
+        if score < self.min_confidence or margin < self.min_margin:
+            self.low_confidence.append({
+                'row': row + self.row_offset, 'question': mcq.question, 'answer': answer,
+                'chosen': mcq.options[index], 'method': method,
+                'score': round(score, 3), 'margin': round(margin, 3)})
+        return mcq._replace(answers=_ANSWER_STRINGS[index])
+
+    def _match(self, answer, options, bigrams):
+        """Return (option index, method, score, margin over the runner-up) for a normalized answer.
+
+        The fuzzy score is the Dice coefficient of character bigrams, which
+        set operations compute much faster than an edit-distance ratio.
+        """
+        if answer in options:
+            return options.index(answer), 'normalized', 1.0, 1.0
+        letter = _LETTER_KEY_RE.fullmatch(answer)
+        if letter:
+            return ord(letter.group(1)) - ord('a'), 'letter', 1.0, 1.0
+
+        def grams(text):
+            value = bigrams.get(text)
+            if value is None:
+                # Pairs of characters rather than 2-char slices: no string objects to build
+                value = bigrams[text] = set(zip(text, text[1:])) or {text}
+            return value
+
+        target = grams(answer)
+        scores = [2 * len(target & other) / (len(target) + len(other)) for other in map(grams, options)]
+        best, runner_up = sorted(scores, reverse=True)[:2]
+        if best < self.min_ratio:
+            return 0, 'unresolved', best, best - runner_up
+        return scores.index(best), 'fuzzy', best, best - runner_up
+
+    def summary(self):
+        counts = ', '.join(f"{self.counts[method]} {method}" for method in self.METHODS)
+        return f"Answer keys resolved: {counts} ({len(self.low_confidence)} low confidence)"
+
+    def write_report(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'counts': self.counts, 'low_confidence': self.low_confidence}, f,
+                      indent=2, ensure_ascii=False)
+
+
+def stable_id(name):
+    """Derive a deterministic Anki deck/model ID from a name."""
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], 'big') % (1 << 30)
+
+
+def question_guid(fields):
+    """Note GUID derived from the question text alone.
+
+    Unlike genanki's default GUID it survives edits to the options or the
+    answer, so an updated question is recognised as the same note.
+    """
+    import genanki
+
+    return genanki.guid_for(MODEL_NAME, fields[1])
+
+
+def read_export_lines(source):
+    """Yield non-empty content lines of an Anki export, one at a time.
+
+    `source` may be a path, '-' for stdin, or an open text file object.
+    Header lines starting with # are skipped.
+    """
+    if source == '-':
+        # UTF-8 like a file, whatever the locale's encoding; detached afterwards so stdin stays open
+        f, close = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'), False
+    elif hasattr(source, 'read'):
+        f, close = source, False
+    else:
+        f, close = open(source, 'r', encoding='utf-8'), True
+    try:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if close:
+            f.close()
+        elif source == '-':
+            f.detach()
+
+
+def _zip_collection(dbfilename, output_file, media_files, timestamp, compresslevel=None):
+    """Zip a finished collection database and media files into an .apkg.
+
+    `output_file` may be a path or any writable binary file object,
+    including unseekable ones such as sys.stdout.buffer. `compresslevel`
+    0 or None stores entries uncompressed (genanki's default); 1-9 deflates
+    them at that level.
+    """
+    import shutil
+    import zipfile
+
+    if compresslevel:
+        compression = {'compression': zipfile.ZIP_DEFLATED, 'compresslevel': compresslevel}
+    else:
+        compression = {'compression': zipfile.ZIP_STORED}
+    # Zip entries cannot be dated before 1980
+    date_time = time.gmtime(max(timestamp, 315532800))[:6]
+
+    def entry(name):
+        # A fixed date keeps output reproducible; ZipInfo entries do not
+        # inherit the archive's compression, so copy it over
+        info = zipfile.ZipInfo(name, date_time)
+        info.compress_type = outzip.compression
+        info._compresslevel = outzip.compresslevel
+        return info
+
+    with zipfile.ZipFile(output_file, 'w', **compression) as outzip:
+        with open(dbfilename, 'rb') as src, outzip.open(entry('collection.anki2'), 'w') as dst:
+            shutil.copyfileobj(src, dst)
+
+        # Media entries are file paths or (name, bytes) pairs
+        media = dict(enumerate(media_files))
+        media_json = {idx: item[0] if isinstance(item, tuple) else os.path.basename(item)
+                      for idx, item in media.items()}
+        outzip.writestr(entry('media'), json.dumps(media_json))
+        for idx, item in media.items():
+            if isinstance(item, tuple):
+                data = item[1]
+            else:
+                with open(item, 'rb') as src:
+                    data = src.read()
+            outzip.writestr(entry(str(idx)), data)
+
+
+def write_package(package, output_file, timestamp=None, compresslevel=None, first_id=None):
+    """Write a genanki Package to an .apkg file or binary file object.
+
+    Same layout as genanki.Package.write_to_file, but when `timestamp` is
+    given every note/card ID and zip entry date derives from it, so the
+    same input always produces the same bytes. Note/card IDs count up from
+    `first_id` if given, otherwise from the timestamp in milliseconds.
+    """
+    import sqlite3
+    import tempfile
+
+    if timestamp is None:
+        timestamp = time.time()
+
+    dbfile, dbfilename = tempfile.mkstemp()
+    os.close(dbfile)
+    try:
+        conn = sqlite3.connect(dbfilename)
+        ids = itertools.count(int(timestamp * 1000) if first_id is None else first_id)
+        package.write_to_db(conn.cursor(), timestamp, ids)
+        conn.commit()
+        conn.close()
+        _zip_collection(dbfilename, output_file, package.media_files, timestamp, compresslevel)
+    finally:
+        os.remove(dbfilename)
+
+
+def _note_rows(ids, guid, fields, model_id, sort_field, req, deck_id, mod):
+    """Return the notes row and cards rows genanki would write for one note."""
+    note_id = next(ids)
+    note = (note_id, guid, model_id, mod, -1, '  ', '\x1f'.join(fields), sort_field, 0, 0, '')
+    cards = []
+    for card_ord, any_or_all, required in req:
+        check = any if any_or_all == 'any' else all
+        if check(fields[i] for i in required):
+            cards.append((next(ids), note_id, deck_id, card_ord, mod, -1,
+                          0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, ''))
+    return note, cards
+
+
+class ApkgWriter:
+    """Stream notes straight into an .apkg's collection database.
+
+    Produces the same rows as genanki's Package/Deck/Note writers (note and
+    card IDs come from the same counter, in the same order), but notes are
+    inserted in batches with executemany inside a single transaction
+    instead of being held as genanki.Note objects, so memory does not grow
+    with the number of notes. Call close() to commit and build the zip, or
+    use it as a context manager, which also closes it on success and
+    discards the temporary database (abort()) if an exception escapes.
+    """
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, output_file, model, timestamp=None, media_files=(), first_id=None,
+                 compresslevel=None):
+        import sqlite3
+        import tempfile
+        import genanki
+        from genanki.apkg_col import APKG_COL
+        from genanki.apkg_schema import APKG_SCHEMA
+
+        self.output_file = output_file
+        self.model = model
+        self.media_files = list(media_files)
+        self.compresslevel = compresslevel
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.note_count = 0
+        # Note/card IDs count up from here (default: the timestamp in ms, like genanki)
+        self._ids = itertools.count(int(self.timestamp * 1000) if first_id is None else first_id)
+        self._guid_for = genanki.guid_for
+        self._decks = []
+        self._notes = []
+        self._cards = []
+        # The model's card requirements are the same for every note
+        self._req = model._req
+
+        dbfile, self._dbfilename = tempfile.mkstemp()
+        os.close(dbfile)
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(self._dbfilename, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode = OFF')
+            self.conn.execute('PRAGMA synchronous = OFF')
+            self.conn.executescript(APKG_SCHEMA)
+            self.conn.executescript(APKG_COL)
+            self.conn.execute('BEGIN')
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_deck(self, deck_id, name):
+        """Register a deck; notes go into the most recently added one by default."""
+        import genanki
+
+        self._decks.append(genanki.Deck(deck_id, name))
+        return deck_id
+
+    def add_note(self, fields, guid=None, deck_id=None):
+        if deck_id is None:
+            deck_id = self._decks[-1].deck_id
+        note, cards = _note_rows(self._ids, guid or self._guid_for(*fields), fields, self.model.model_id,
+                                 fields[self.model.sort_field_index], self._req, deck_id,
+                                 int(self.timestamp))
+        self._notes.append(note)
+        self._cards.extend(cards)
+        self.note_count += 1
+        if len(self._notes) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self.conn.executemany('INSERT INTO notes VALUES(?,?,?,?,?,?,?,?,?,?,?)', self._notes)
+        self.conn.executemany('INSERT INTO cards VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', self._cards)
+        self._notes.clear()
+        self._cards.clear()
+
+    def abort(self):
+        """Close the database and delete it without writing a package."""
+        if self._dbfilename is None:
+            return
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        finally:
+            os.remove(self._dbfilename)
+            self._dbfilename = None
+
+    def close(self):
+        """Commit the collection and write the .apkg file (once; later calls do nothing)."""
+        if self._dbfilename is None:
+            return
+        try:
+            self._flush()
+            decks_json, models_json = self.conn.execute('SELECT decks, models FROM col').fetchone()
+            decks = json.loads(decks_json)
+            models = json.loads(models_json)
+            for deck in self._decks:
+                decks[str(deck.deck_id)] = deck.to_json()
+                models[self.model.model_id] = self.model.to_json(self.timestamp, deck.deck_id)
+            self.conn.execute('UPDATE col SET decks = ?, models = ?',
+                              (json.dumps(decks), json.dumps(models)))
+            self.conn.execute('COMMIT')
+            self.conn.close()
+            _zip_collection(self._dbfilename, self.output_file, self.media_files, self.timestamp,
+                            self.compresslevel)
+        finally:
+            self.abort()
+
+
+class NoteStore:
+    """Columnar in-memory store of note fields for very large decks.
+
+    Low-cardinality columns (by default the blank/constant fields and the
+    answers string) are interned: each note keeps a 4-byte index into a
+    table of distinct values. All other field text, plus any explicit GUID,
+    is appended as UTF-8 to one contiguous bytearray, with an array of end
+    offsets. A note therefore costs its text plus a few dozen bytes, instead
+    of a genanki.Note holding a list of separate str objects. Rows are
+    materialized as strings only while iterating, e.g. when ApkgWriter
+    serializes the store.
+    """
+
+    def __init__(self, num_fields, interned=(0, 2, 7, 8, 9, 10)):
+        self.num_fields = num_fields
+        self.interned = tuple(interned)
+        self.text_columns = tuple(i for i in range(num_fields) if i not in self.interned)
+        self._values = []
+        self._value_ids = {}
+        self._codes = array('I')
+        self._text = bytearray()
+        self._ends = array('Q')
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, fields, guid=None):
+        value_ids = self._value_ids
+        for column in self.interned:
+            value = fields[column]
+            code = value_ids.get(value)
+            if code is None:
+                code = value_ids[value] = len(self._values)
+                self._values.append(value)
+            self._codes.append(code)
+        text, ends = self._text, self._ends
+        for column in self.text_columns:
+            text += fields[column].encode('utf-8')
+            ends.append(len(text))
+        # An empty GUID means genanki's default, derived from the fields
+        text += (guid or '').encode('utf-8')
+        ends.append(len(text))
+        self._count += 1
+
+    def __iter__(self):
+        """Yield (fields, guid) rows, decoding each note's text on demand."""
+        values, codes, ends = self._values, self._codes, self._ends
+        interned, text_columns = self.interned, self.text_columns
+        per_codes, per_ends = len(interned), len(text_columns) + 1
+        text = memoryview(self._text)
+        try:
+            start = 0
+            for n in range(self._count):
+                fields = [None] * self.num_fields
+                base = n * per_codes
+                for j, column in enumerate(interned):
+                    fields[column] = values[codes[base + j]]
+                base = n * per_ends
+                for j, column in enumerate(text_columns):
+                    end = ends[base + j]
+                    fields[column] = str(text[start:end], 'utf-8')
+                    start = end
+                end = ends[base + per_ends - 1]
+                guid = str(text[start:end], 'utf-8') or None
+                start = end
+                yield fields, guid
+        finally:
+            text.release()
+
+    def nbytes(self):
+        """Approximate memory held by the store's buffers."""
+        return (len(self._text) + self._ends.itemsize * len(self._ends)
+                + self._codes.itemsize * len(self._codes))
+
+class ParseCache:
+    """Persistent SQLite cache of parsed export lines.
+
+    Maps a hash of each raw line to the note fields it produced (or to
+    nothing, for lines that do not parse) and the note's GUID, so a re-run
+    on a slightly edited export only parses and escapes the changed lines.
+    Entries are stamped with the run that last used them; when the cache
+    grows past `max_entries` the least recently used ones are evicted.
+    """
+
+    FLUSH_EVERY = 10000
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = self.misses = self.evictions = 0
+        import sqlite3
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS lines ('
+            'hash BLOB PRIMARY KEY, fields TEXT, guid TEXT, used INTEGER NOT NULL)')
+        self.run = int(time.time() * 1000)
+        self._touched = []
+        self._added = []
+
+    @staticmethod
+    def key(line, salt=b''):
+        """Hash a line; a salt keeps entries from differently configured runs apart."""
+        return hashlib.blake2b(line.encode('utf-8'), digest_size=16, salt=salt).digest()
+
+    def get(self, key):
+        """Return (fields, guid) for a cached line, or None on a miss."""
+        row = self.conn.execute('SELECT fields, guid FROM lines WHERE hash = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append((self.run, key))
+        if len(self._touched) >= self.FLUSH_EVERY:
+            self.flush()
+        fields, guid = row
+        return (json.loads(fields) if fields is not None else None), guid
+
+    def put(self, key, fields, guid):
+        """Record the outcome for a line; fields is None if it did not parse."""
+        self._added.append((key, json.dumps(fields) if fields is not None else None, guid, self.run))
+        if len(self._added) >= self.FLUSH_EVERY:
+            self.flush()
+        return fields, guid
+
+    def flush(self):
+        with self.conn:
+            self.conn.executemany('UPDATE lines SET used = ? WHERE hash = ?', self._touched)
+            self.conn.executemany('INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?)', self._added)
+        self._touched.clear()
+        self._added.clear()
+
+    def close(self):
+        """Flush pending writes and evict entries beyond the size cap."""
+        self.flush()
+        with self.conn:
+            count, = self.conn.execute('SELECT COUNT(*) FROM lines').fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    'DELETE FROM lines WHERE hash IN '
+                    '(SELECT hash FROM lines ORDER BY used LIMIT ?)', (excess,))
+                self.evictions += excess
+        self.conn.close()
+
+    def report(self):
+        return f"Cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+class ConversionStats:
+    """Per-stage wall time and item counters for a conversion.
+
+    Stages are 'read', 'parse', 'escape', 'note' and 'write'; counters
+    include rows rejected by parse_mcq_record (by reason) and rows whose
+    correct answer fell back to the first option. Each hook is called as
+    hook(stage, seconds, count) when a stage's totals are published, i.e.
+    at the end of every convert and write step. Each step hook is called
+    once per step as step_hook(stages), with the stages that step published.
+    """
+
+    def __init__(self, hooks=(), step_hooks=()):
+        self.seconds = defaultdict(float)
+        self.items = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.hooks = list(hooks)
+        self.step_hooks = list(step_hooks)
+
+    def timed(self, stage, fn):
+        """Wrap fn so that each call adds its wall time and one item to `stage`."""
+        seconds, items, clock = self.seconds, self.items, time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds[stage] += clock() - start
+                items[stage] += 1
+        return wrapper
+
+    def timed_iter(self, stage, iterable):
+        """Yield from iterable, charging the time spent producing each item to `stage`."""
+        seconds, items, clock = self.seconds, self.items, time.perf_counter
+        it = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                seconds[stage] += clock() - start
+                return
+            seconds[stage] += clock() - start
+            items[stage] += 1
+            yield item
+
+    @contextmanager
+    def stage(self, stage, items=0):
+        """Time a block as one step of `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+            self.items[stage] += items
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def publish(self, *stages):
+        """Call every hook with the current totals of the given stages."""
+        for stage in stages:
+            for hook in self.hooks:
+                hook(stage, self.seconds[stage], self.items[stage])
+        for step_hook in self.step_hooks:
+            step_hook(stages)
+
+    def as_dict(self):
+        return {
+            'stages': {stage: {'seconds': self.seconds[stage], 'items': self.items[stage]}
+                       for stage in self.seconds},
+            'counters': dict(self.counters),
+        }
+
+    def format(self):
+        lines = [f"{stage:<8} {data['seconds']:9.3f} s  {data['items']:>10} items"
+                 for stage, data in self.as_dict()['stages'].items()]
+        lines += [f"{counter}: {n}" for counter, n in sorted(self.counters.items())]
+        return '\n'.join(lines)
 
 class MCQConverter:
-    def __init__(self, deck_name="Multiple Choice Questions"):
-        self.deck_id = random.randrange(1 << 30, 1 << 31)
+    def __init__(self, deck_name="Multiple Choice Questions", deck_id=None, model_id=None, stats=None,
+                 external_script=False, compact=False, model=None, resolver=None):
+        import genanki
+
+        # Optional ConversionStats; None keeps the conversion loops uninstrumented
+        self.stats = stats
+        # Optional AnswerResolver for answer keys that match no option exactly
+        self.resolver = resolver
+
+        # Random IDs unless the caller asks for stable ones (see stable_id)
+        self.deck_id = deck_id or random.randrange(1 << 30, 1 << 31)
         self.deck = genanki.Deck(self.deck_id, deck_name)
+
+        # With external_script the card logic ships once as a media file
+        qfmt, afmt = card_templates(external_script)
+        self.media_files = [(card_script_name(), CARD_SCRIPT.encode('utf-8'))] if external_script else []
+
+        # With compact=True notes go into a columnar NoteStore instead of genanki.Note objects
+        self.store = None
         
-        # Define the model for AllInOne card type
-        self.model = genanki.Model(
-            random.randrange(1 << 30, 1 << 31),
-            'AllInOne (kprim, mc, sc)',
+        # Define the model for AllInOne card type, unless a pre-built one is
+        # passed in (see shared_model); model_id is ignored in that case
+        self.model = model or genanki.Model(
+            model_id or random.randrange(1 << 30, 1 << 31),
+            MODEL_NAME,
             fields=[
                 {'name': 'Title'},           # Always blank
                 {'name': 'Question'},        # Question text
@@ -29,350 +1022,8 @@ class MCQConverter:
             ],
             templates=[{
                 'name': 'Card 1',
-                'qfmt': '''
-                    <div class="question">{{Question}}</div>
-                    <div id="options-container">
-                        <!-- Options will be dynamically generated and shuffled -->
-                    </div>
-                    <div id="selected-option" style="display:none;">{{selected-option}}</div>
-                    <div id="answers" style="display:none;">{{Answers}}</div>
-                    <div id="shuffle-order" style="display:none;">{{ShuffleOrder}}</div>
-                    
-                    <!-- Hidden option data -->
-                    <div style="display:none;" id="option-data">
-                        {{#Q_1}}<div data-index="0">{{Q_1}}</div>{{/Q_1}}
-                        {{#Q_2}}<div data-index="1">{{Q_2}}</div>{{/Q_2}}
-                        {{#Q_3}}<div data-index="2">{{Q_3}}</div>{{/Q_3}}
-                        {{#Q_4}}<div data-index="3">{{Q_4}}</div>{{/Q_4}}
-                    </div>
-                    
-                    <script>
-                    // Create a unique identifier for this card based on its content
-                    function getCardId() {
-                        const question = document.querySelector('.question').textContent.trim();
-                        const optionData = document.getElementById('option-data');
-                        const options = Array.from(optionData.children).map(el => el.textContent.trim()).join('|');
-                        return btoa(question + '|||' + options).substring(0, 20); // Base64 encoded, shortened
-                    }
-                    
-                    // Simple random shuffle function
-                    function shuffleArray(array) {
-                        const shuffled = [...array];
-                        for (let i = shuffled.length - 1; i > 0; i--) {
-                            const j = Math.floor(Math.random() * (i + 1));
-                            [shuffled[i], shuffled[j]] = [shuffled[j], shuffled[i]];
-                        }
-                        return shuffled;
-                    }
-                    
-                    // Get options and create shuffle order - ONLY ONCE per card
-                    function getOrCreateShuffleOrder() {
-                        const cardId = getCardId();
-                        const sessionKey = 'cardShuffle_' + cardId;
-                        
-                        // Check if we have a session shuffle order for this specific card
-                        if (window[sessionKey]) {
-                            return window[sessionKey];
-                        }
-                        
-                        // Check if we have a stored shuffle order in the hidden field
-                        const shuffleOrderEl = document.getElementById('shuffle-order');
-                        const storedOrder = shuffleOrderEl.textContent.trim();
-                        
-                        if (storedOrder && storedOrder !== '{{ShuffleOrder}}' && storedOrder !== '') {
-                            try {
-                                const parsed = JSON.parse(storedOrder);
-                                window[sessionKey] = parsed; // Store in session
-                                return parsed;
-                            } catch (e) {
-                                // If parsing fails, create a new shuffle order
-                            }
-                        }
-                        
-                        // Create new shuffle order for this card
-                        const optionData = document.getElementById('option-data');
-                        const options = Array.from(optionData.children).filter(el => el.textContent.trim() !== '');
-                        
-                        if (options.length === 0) return [];
-                        
-                        // Create option objects with original indices for THIS CARD'S options
-                        const optionObjects = options.map((el, i) => ({
-                            text: el.textContent.trim(),
-                            originalIndex: parseInt(el.getAttribute('data-index'))
-                        }));
-                        
-                        // Create shuffle order and store it for this card
-                        const shuffledOrder = shuffleArray(optionObjects);
-                        
-                        // Store in both session and hidden field
-                        window[sessionKey] = shuffledOrder;
-                        shuffleOrderEl.textContent = JSON.stringify(shuffledOrder);
-                        
-                        return shuffledOrder;
-                    }
-                    
-                    // Initialize front side options
-                    function initializeFrontSide() {
-                        const container = document.getElementById('options-container');
-                        const shuffledOptions = getOrCreateShuffleOrder();
-                        
-                        if (shuffledOptions.length === 0) return;
-                        
-                        // Display options in shuffled order
-                        container.innerHTML = '';
-                        shuffledOptions.forEach((option, i) => {
-                            const wrapper = document.createElement('div');
-                            wrapper.className = 'option-wrapper';
-                            wrapper.setAttribute('data-index', option.originalIndex);
-                            wrapper.onclick = function() { ankiSelectOption(option.originalIndex); };
-                            
-                            const optionDiv = document.createElement('div');
-                            optionDiv.className = 'option';
-                            optionDiv.textContent = String.fromCharCode(65 + i) + ') ' + option.text;
-                            
-                            wrapper.appendChild(optionDiv);
-                            container.appendChild(wrapper);
-                        });
-                    }
-                    
-                    function checkAnswer(index) {
-                        var answersStr = document.getElementById('answers').textContent.trim();
-                        var answers = answersStr.split(" ");
-                        return answers[index] === "1";
-                    }
-
-                    function showFeedback(isCorrect) {
-                        // Remove existing feedback
-                        var existing = document.querySelectorAll('.answer-feedback');
-                        existing.forEach(el => el.remove());
-                        
-                        var feedbackDiv = document.createElement('div');
-                        feedbackDiv.className = 'answer-feedback';
-                        feedbackDiv.textContent = isCorrect ? '✓ Correct!' : '✗ Incorrect';
-                        feedbackDiv.style.backgroundColor = isCorrect ? '#4CAF50' : '#f44336';
-                        feedbackDiv.style.color = 'white';
-                        feedbackDiv.style.position = 'fixed';
-                        feedbackDiv.style.bottom = '20px';
-                        feedbackDiv.style.left = '50%';
-                        feedbackDiv.style.transform = 'translateX(-50%)';
-                        feedbackDiv.style.padding = '12px 24px';
-                        feedbackDiv.style.borderRadius = '8px';
-                        feedbackDiv.style.fontWeight = 'bold';
-                        feedbackDiv.style.zIndex = '1000';
-                        document.body.appendChild(feedbackDiv);
-                        
-                        // Remove feedback after 2 seconds
-                        setTimeout(function() {
-                            feedbackDiv.remove();
-                        }, 2000);
-                    }
-
-                    function ankiSelectOption(index) {
-                        // Prevent multiple selections
-                        var allOptions = document.querySelectorAll('.option-wrapper');
-                        var alreadyAnswered = Array.from(allOptions).some(opt => 
-                            opt.className.includes('selected-') || opt.className.includes('correct'));
-                        
-                        if (alreadyAnswered) return; // Don't allow re-selection
-                        
-                        // Clear all option styles first
-                        allOptions.forEach(opt => opt.className = 'option-wrapper disabled');
-                        
-                        var selected = document.querySelector('.option-wrapper[data-index="' + index + '"]');
-                        if (selected) {
-                            var isCorrect = checkAnswer(index);
-                            selected.className = 'option-wrapper ' + (isCorrect ? 'selected-correct' : 'selected-incorrect');
-                            
-                            showFeedback(isCorrect);
-                            
-                            // Always show the correct answer(s) for learning
-                            var answers = document.getElementById('answers').textContent.trim().split(" ");
-                            answers.forEach((ans, i) => {
-                                if (ans === "1") {
-                                    var correct = document.querySelector('.option-wrapper[data-index="' + i + '"]');
-                                    if (correct && !correct.className.includes('selected-')) {
-                                        correct.className = 'option-wrapper correct disabled';
-                                    }
-                                }
-                            });
-                            
-                            // Store selection
-                            var hidden = document.getElementById('selected-option');
-                            if (hidden) hidden.textContent = index;
-                            
-                            // Disable clicking on all options
-                            allOptions.forEach(opt => {
-                                opt.onclick = null;
-                                opt.style.cursor = 'default';
-                            });
-                            
-                            // Show native Anki review buttons by triggering answer state
-                            setTimeout(function() {
-                                // Trigger Anki's native answer state to show review buttons
-                                if (typeof pycmd !== 'undefined') {
-                                    pycmd('ans');
-                                }
-                            }, 2000); // Give time to see the feedback
-                        }
-                    }
-                    
-                    // Initialize when page loads - FRONT SIDE ONLY
-                    document.addEventListener('DOMContentLoaded', initializeFrontSide);
-                    if (document.readyState !== 'loading') {
-                        initializeFrontSide();
-                    }
-                    </script>
-                ''',
-                'afmt': '''
-                    <div class="question">{{Question}}</div>
-                    <div id="options-container-back">
-                        <!-- Options will be displayed with answer highlighting -->
-                    </div>
-                    <div id="selected-option" style="display:none;">{{selected-option}}</div>
-                    <div id="answers" style="display:none;">{{Answers}}</div>
-                    <div id="shuffle-order" style="display:none;">{{ShuffleOrder}}</div>
-                    
-                    <!-- Hidden option data -->
-                    <div style="display:none;" id="option-data">
-                        {{#Q_1}}<div data-index="0">{{Q_1}}</div>{{/Q_1}}
-                        {{#Q_2}}<div data-index="1">{{Q_2}}</div>{{/Q_2}}
-                        {{#Q_3}}<div data-index="2">{{Q_3}}</div>{{/Q_3}}
-                        {{#Q_4}}<div data-index="3">{{Q_4}}</div>{{/Q_4}}
-                    </div>
-                    
-                    <script>
-                    // Create a unique identifier for this card based on its content
-                    function getCardId() {
-                        const question = document.querySelector('.question').textContent.trim();
-                        const optionData = document.getElementById('option-data');
-                        const options = Array.from(optionData.children).map(el => el.textContent.trim()).join('|');
-                        return btoa(question + '|||' + options).substring(0, 20); // Base64 encoded, shortened
-                    }
-                    
-                    // Get the SAME shuffle order that was created on the front side
-                    function getStoredShuffleOrder() {
-                        const cardId = getCardId();
-                        const sessionKey = 'cardShuffle_' + cardId;
-                        
-                        // First check if we have it in session storage
-                        if (window[sessionKey]) {
-                            return window[sessionKey];
-                        }
-                        
-                        // Try to get stored shuffle order from hidden field
-                        const shuffleOrderDiv = document.getElementById('shuffle-order');
-                        const storedOrder = shuffleOrderDiv.textContent.trim();
-                        
-                        if (storedOrder && storedOrder !== '{{ShuffleOrder}}' && storedOrder !== '') {
-                            try {
-                                const parsed = JSON.parse(storedOrder);
-                                window[sessionKey] = parsed; // Store in session for consistency
-                                return parsed;
-                            } catch (e) {
-                                // If parsing fails, fall back to original order
-                            }
-                        }
-                        
-                        // Fallback: create original order from this card's options
-                        const optionData = document.getElementById('option-data');
-                        const options = Array.from(optionData.children).filter(el => el.textContent.trim() !== '');
-                        return options.map((el, i) => ({
-                            text: el.textContent.trim(),
-                            originalIndex: parseInt(el.getAttribute('data-index'))
-                        }));
-                    }
-                    
-                    // Initialize back side with EXACT same shuffle order and selection state from front side
-                    function initializeBackSide() {
-                        const container = document.getElementById('options-container-back');
-                        const shuffleOrder = getStoredShuffleOrder();
-                        
-                        if (shuffleOrder.length === 0) return;
-                        
-                        const selectedOptionDiv = document.getElementById('selected-option');
-                        const selectedIndex = selectedOptionDiv.textContent.trim() !== '' && 
-                                           selectedOptionDiv.textContent.trim() !== '{{selected-option}}' ? 
-                                           parseInt(selectedOptionDiv.textContent.trim()) : -1;
-                        
-                        // Display options in SAME shuffled order as front side
-                        container.innerHTML = '';
-                        shuffleOrder.forEach((option, i) => {
-                            const wrapper = document.createElement('div');
-                            wrapper.className = 'option-wrapper disabled';
-                            wrapper.setAttribute('data-index', option.originalIndex);
-                            
-                            const optionDiv = document.createElement('div');
-                            optionDiv.className = 'option';
-                            optionDiv.textContent = String.fromCharCode(65 + i) + ') ' + option.text;
-                            
-                            // Apply highlighting to match front side state
-                            const isSelected = option.originalIndex === selectedIndex;
-                            const isCorrect = checkAnswerBack(option.originalIndex);
-                            
-                            if (isSelected) {
-                                // Show user's selection with appropriate styling
-                                wrapper.className = 'option-wrapper ' + (isCorrect ? 'selected-correct' : 'selected-incorrect') + ' disabled';
-                            } else if (isCorrect) {
-                                // Always show correct answers highlighted for learning
-                                wrapper.className = 'option-wrapper correct disabled';
-                            } else {
-                                // Regular options remain neutral
-                                wrapper.className = 'option-wrapper disabled';
-                            }
-                            
-                            wrapper.appendChild(optionDiv);
-                            container.appendChild(wrapper);
-                        });
-                        
-                        // Show the same feedback message on back side if user made a selection
-                        if (selectedIndex !== -1) {
-                            const isCorrect = checkAnswerBack(selectedIndex);
-                            showBackSideFeedback(isCorrect);
-                        }
-                    }
-                    
-                    // Show feedback message on back side to match front side experience
-                    function showBackSideFeedback(isCorrect) {
-                        // Remove any existing feedback first
-                        const existing = document.querySelectorAll('.answer-feedback');
-                        existing.forEach(el => el.remove());
-                        
-                        const feedbackDiv = document.createElement('div');
-                        feedbackDiv.className = 'answer-feedback';
-                        feedbackDiv.textContent = isCorrect ? '✓ Correct!' : '✗ Incorrect';
-                        feedbackDiv.style.backgroundColor = isCorrect ? '#4CAF50' : '#f44336';
-                        feedbackDiv.style.color = 'white';
-                        feedbackDiv.style.position = 'fixed';
-                        feedbackDiv.style.bottom = '20px';
-                        feedbackDiv.style.left = '50%';
-                        feedbackDiv.style.transform = 'translateX(-50%)';
-                        feedbackDiv.style.padding = '12px 24px';
-                        feedbackDiv.style.borderRadius = '8px';
-                        feedbackDiv.style.fontWeight = 'bold';
-                        feedbackDiv.style.zIndex = '1000';
-                        feedbackDiv.style.animation = 'fadeIn 0.3s ease';
-                        
-                        document.body.appendChild(feedbackDiv);
-                        
-                        // Keep feedback visible longer on back side since it's more permanent
-                        setTimeout(function() {
-                            feedbackDiv.remove();
-                        }, 4000); // 4 seconds instead of 2
-                    }
-                    
-                    function checkAnswerBack(index) {
-                        var answersStr = document.getElementById('answers').textContent.trim();
-                        var answers = answersStr.split(" ");
-                        return answers[index] === "1";
-                    }
-                    
-                    // Initialize when page loads - only on back side
-                    document.addEventListener('DOMContentLoaded', initializeBackSide);
-                    if (document.readyState !== 'loading') {
-                        initializeBackSide();
-                    }
-                    </script>
-                '''
+                'qfmt': qfmt,
+                'afmt': afmt,
             }],
             css='''
                 .card {
@@ -448,9 +1099,16 @@ class MCQConverter:
                 }
             '''
         )
+        if compact:
+            self.store = NoteStore(len(self.model.fields))
 
-    def parse_mcq_line(self, line):
-        """Parse a single MCQ line from Anki export format."""
+    @staticmethod
+    def parse_mcq_line(line):
+        """Parse a single MCQ line from Anki export format.
+
+        Reference implementation returning a dict; the conversion pipeline
+        uses the equivalent, faster parse_mcq_record.
+        """
         parts = line.split('\t')
         if len(parts) != 2:
             return None
@@ -479,54 +1137,928 @@ class MCQConverter:
             'answers': ' '.join(answers)
         }
 
-    def convert_file(self, input_file):
-        """Convert an Anki export file to a new MCQ deck."""
-        with open(input_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+    def iter_mcqs(self, source):
+        """Lazily parse MCQ records from a path, '-' (stdin) or a text file object."""
+        resolver = self.resolver
+        if self.stats is None and resolver is None:
+            for line in read_export_lines(source):
+                mcq = parse_mcq_record(line)
+                if mcq:
+                    yield mcq
+            return
 
-        # Skip header lines starting with #
-        content_lines = [line for line in lines if not line.startswith('#')]
+        # Only a first-option answer can be a silent fallback, so only those rows are resolved
+        fallback = _ANSWER_STRINGS[0]
+        if self.stats is None:
+            resolve = resolver.resolve
+            for row, line in enumerate(read_export_lines(source)):
+                mcq = parse_mcq_record(line)
+                if mcq:
+                    yield resolve(row, line, mcq) if mcq.answers is fallback else mcq
+            return
 
-        for line in content_lines:
-            line = line.strip()
-            if not line:
+        for row, line, mcq in self._parsed_rows(source):
+            if resolver is not None and mcq.answers is fallback:
+                mcq = resolver.resolve(row, line, mcq, self.stats)
+            yield mcq
+
+    def _parsed_rows(self, source):
+        """Yield (row, line, MCQRecord) for every valid row, timing stages and counting rejects."""
+        stats = self.stats
+        parse = stats.timed('parse', parse_mcq_record)
+        for row, line in enumerate(stats.timed_iter('read', read_export_lines(source))):
+            mcq = parse(line)
+            if mcq is None:
+                stats.count('rejected_' + reject_reason(line))
                 continue
-                
-            mcq = self.parse_mcq_line(line)
-            if mcq:
-                # Create note with the MCQ data
-                note = genanki.Note(
-                    model=self.model,
-                    fields=[
-                        '',  # Title (blank)
-                        html.escape(mcq['question']),
-                        '2',  # Q type (2 for single choice)
-                        *[html.escape(opt) for opt in mcq['options']],
-                        *('' for _ in range(4 - len(mcq['options']))),  # Pad with empty strings if less than 4 options
-                        '',  # Q_5 (optional 5th option)
-                        mcq['answers'],
-                        '',  # ShuffleOrder (empty initially)
-                        '',  # selected-option (empty initially)
-                    ]
-                )
-                self.deck.add_note(note)
-
-    def save_deck(self, output_file):
-        """Save the deck to an .apkg file."""
-        genanki.Package(self.deck).write_to_file(output_file)
+            if not answer_matched(line, mcq):
+                stats.count('answer_fallback')
+            yield row, line, mcq
+
+    @staticmethod
+    def note_fields(mcq):
+        """Return the model's field values for a parsed MCQRecord."""
+        return [
+            '',  # Title (blank)
+            html.escape(mcq.question),
+            '2',  # Q type (2 for single choice)
+            *map(html.escape, mcq.options),
+            *('' for _ in range(4 - len(mcq.options))),  # Pad with empty strings if less than 4 options
+            '',  # Q_5 (optional 5th option)
+            mcq.answers,
+            '',  # ShuffleOrder (empty initially)
+            '',  # selected-option (empty initially)
+        ]
+
+    def build_note(self, mcq):
+        """Create a genanki note for a parsed MCQ record."""
+        import genanki
+
+        return genanki.Note(model=self.model, fields=self.note_fields(mcq))
+
+    @property
+    def note_count(self):
+        return len(self.store) if self.store is not None else len(self.deck.notes)
+
+    def add_note(self, fields, guid=None):
+        """Add a note from its field values to the deck (or the compact store)."""
+        import genanki
+
+        if self.store is not None:
+            self.store.add(fields, guid)
+        else:
+            self.deck.add_note(genanki.Note(model=self.model, fields=fields, guid=guid))
+
+    def convert_records(self, mcqs):
+        """Add notes for already-parsed MCQRecords, e.g. from the OCR or document importers."""
+        for mcq in mcqs:
+            self.add_note(self.note_fields(mcq))
+
+    def iter_note_fields(self, input_file, cache=None):
+        """Yield (fields, guid) for every valid MCQ in an export.
+
+        The input is streamed line by line, so it can be a path, '-' for
+        stdin, or any iterable text file object. With a ParseCache, lines
+        seen in an earlier run skip parsing and escaping entirely. A guid of
+        None means genanki's default content-derived GUID.
+        """
+        stats = self.stats
+        note_fields = self.note_fields if stats is None else stats.timed('escape', self.note_fields)
+        if cache is None:
+            for mcq in self.iter_mcqs(input_file):
+                yield note_fields(mcq), None
+            return
+
+        import genanki
+
+        lines = read_export_lines(input_file)
+        parse = parse_mcq_record
+        if stats is not None:
+            lines = stats.timed_iter('read', lines)
+            parse = stats.timed('parse', parse_mcq_record)
+        resolver = self.resolver
+        salt = b'' if resolver is None else b'resolved'
+        for row, line in enumerate(lines):
+            key = cache.key(line, salt)
+            cached = cache.get(key)
+            if cached is None:
+                mcq = parse(line)
+                if stats is not None:
+                    if mcq is None:
+                        stats.count('rejected_' + reject_reason(line))
+                    elif not answer_matched(line, mcq):
+                        stats.count('answer_fallback')
+                if mcq and resolver is not None and mcq.answers is _ANSWER_STRINGS[0]:
+                    # Only lines missing from the cache are resolved (and reported)
+                    mcq = resolver.resolve(row, line, mcq, stats)
+                fields = note_fields(mcq) if mcq else None
+                guid = genanki.guid_for(*fields) if mcq else None
+                cached = cache.put(key, fields, guid)
+            fields, guid = cached
+            if fields is not None:
+                yield fields, guid
+
+    def convert_file(self, input_file, cache=None):
+        """Convert an Anki export file to a new MCQ deck."""
+        import genanki
+
+        if self.store is not None:
+            add = self.store.add if self.stats is None else self.stats.timed('note', self.store.add)
+            for fields, guid in self.iter_note_fields(input_file, cache):
+                add(fields, guid)
+        else:
+            make_note = genanki.Note if self.stats is None else self.stats.timed('note', genanki.Note)
+            for fields, guid in self.iter_note_fields(input_file, cache):
+                self.deck.add_note(make_note(model=self.model, fields=fields, guid=guid))
+        if self.stats is not None:
+            self.stats.publish('read', 'parse', 'escape', 'note')
+
+    def convert_to_apkg(self, input_file, output_file, cache=None, timestamp=None, compresslevel=None):
+        """Stream an export straight into an .apkg without building the deck in memory.
+
+        Equivalent to convert_file() followed by save_deck(), but uses
+        ApkgWriter so memory stays flat regardless of note count. Returns
+        the number of notes written.
+        """
+        with ApkgWriter(output_file, self.model, timestamp, self.media_files,
+                        compresslevel=compresslevel) as writer:
+            writer.add_deck(self.deck_id, self.deck.name)
+            add_note = writer.add_note if self.stats is None else self.stats.timed('write', writer.add_note)
+            for fields, guid in self.iter_note_fields(input_file, cache):
+                add_note(fields, guid)
+            if self.stats is None:
+                writer.close()
+                return writer.note_count
+
+            with self.stats.stage('write'):
+                writer.close()
+        self.stats.publish('read', 'parse', 'escape', 'write')
+        return writer.note_count
+
+    def _write_store(self, output_file, timestamp, compresslevel, first_id):
+        with ApkgWriter(output_file, self.model, timestamp, self.media_files, first_id,
+                        compresslevel) as writer:
+            writer.add_deck(self.deck_id, self.deck.name)
+            for fields, guid in self.store:
+                writer.add_note(fields, guid)
+
+    def save_deck(self, output_file, timestamp=None, compresslevel=None, first_id=None):
+        """Save the deck to an .apkg file or writable binary file object.
+
+        `compresslevel` 0 or None stores the package uncompressed (fastest),
+        1-9 deflates it (9 is smallest, for distribution). `first_id` sets
+        where note/card IDs start (default: the timestamp in milliseconds).
+        """
+        import genanki
+
+        if self.store is not None:
+            def write():
+                self._write_store(output_file, timestamp, compresslevel, first_id)
+        else:
+            def write():
+                write_package(genanki.Package(self.deck, media_files=self.media_files), output_file,
+                              timestamp, compresslevel, first_id)
+        if self.stats is None:
+            write()
+            return
+
+        with self.stats.stage('write', self.note_count):
+            write()
+        self.stats.publish('write')
+
+
+@functools.lru_cache(maxsize=None)
+def shared_model(external_script=False):
+    """Return this process's pre-built note model with the stable model ID.
+
+    Building the model and its card requirements costs a few milliseconds,
+    so long-running services build it once and pass it to every
+    MCQConverter as `model`. Treat it as read-only.
+    """
+    model = MCQConverter(model_id=stable_id(MODEL_NAME), external_script=external_script).model
+    model._req  # cached property; compute it now rather than on the first save
+    return model
+
+
+def check_export(source):
+    """Parse an export without building anything and count the outcomes.
+
+    Returns a dict with the number of valid rows, rows parse_mcq_line
+    would skip, and valid rows whose correct answer matched no option (and
+    so silently fell back to the first one).
+    """
+    counts = {'valid': 0, 'skipped': 0, 'unmatched': 0}
+    for line in read_export_lines(source):
+        mcq = parse_mcq_record(line)
+        if mcq is None:
+            counts['skipped'] += 1
+            continue
+        counts['valid'] += 1
+        if not answer_matched(line, mcq):
+            counts['unmatched'] += 1
+    return counts
+
+
+def remove_duplicates(records, threshold=0.8, report_file=None):
+    """Drop exact and near-duplicate MCQRecords, keeping first occurrences.
+
+    See dedupe.find_duplicates for how similarity is measured. Returns the
+    kept records and the number merged; the merged clusters are written to
+    `report_file` as JSON if given.
+    """
+    from dedupe import find_duplicates
+
+    records = list(records)
+    result = find_duplicates(records, threshold)
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(result.report(records), f, indent=2, ensure_ascii=False)
+    return [mcq for mcq, keep in zip(records, result.keep) if keep], result.merged
+
+
+def parse_export_file(path):
+    """Parse every MCQ in one export file (process pool worker)."""
+    return [mcq for mcq in map(parse_mcq_record, read_export_lines(path)) if mcq]
+
+
+def parse_size(text):
+    """Parse a byte size such as '500000', '64K', '50M' or '1G'."""
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_row_range(text):
+    """Parse a 'START:STOP' row range (0-based, either end may be omitted)."""
+    start, sep, stop = text.partition(':')
+    if not sep:
+        raise ValueError(f"expected START:STOP, got {text!r}")
+    return int(start) if start else 0, int(stop) if stop else None
+
+
+def write_shard(path, deck_name, deck_id, model_id, rows, timestamp, first_id, external_script=False,
+                compresslevel=None):
+    """Write one shard package from (fields, guid) rows (process pool worker).
+
+    Returns the shard's manifest entry.
+    """
+    converter = MCQConverter(deck_name, deck_id=deck_id, model_id=model_id, external_script=external_script)
+    with ApkgWriter(path, converter.model, timestamp, converter.media_files, first_id,
+                    compresslevel) as writer:
+        writer.add_deck(deck_id, deck_name)
+        for fields, guid in rows:
+            writer.add_note(fields, guid)
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return {'file': os.path.basename(path), 'deck': deck_name, 'notes': writer.note_count,
+            'bytes': os.path.getsize(path), 'sha256': digest.hexdigest()}
+
+
+def convert_sharded(input_file, output_dir, deck_name="Multiple Choice Questions", max_notes=None,
+                    max_bytes=None, workers=None, external_script=False, compresslevel=None,
+                    resolver=None):
+    """Split an export into size-bounded .apkg shards written in parallel.
+
+    Notes are streamed from the input and cut into shards of at most
+    `max_notes` notes and/or `max_bytes` bytes of field text. Each shard is
+    a "<deck_name>::Part NNN" subdeck in its own package, written by a pool
+    worker while the next shard is being filled. A manifest.json listing
+    every shard's note count, size and SHA-256 is written to `output_dir`;
+    shards whose worker failed are listed with their error so they can be
+    rebuilt on their own. Answer keys are fixed with `resolver` (an
+    AnswerResolver) if given, before the rows are cut into shards. Returns
+    the manifest.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    if not max_notes and not max_bytes:
+        raise ValueError('convert_sharded needs max_notes or max_bytes')
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    timestamp = float(os.environ.get('SOURCE_DATE_EPOCH') or time.time())
+    model_id = stable_id(MODEL_NAME)
+    stem = re.sub(r'[^\w-]+', '_', deck_name).strip('_') or 'deck'
+    # Every shard gets its own range of note/card IDs so they can all be imported
+    next_id = int(timestamp * 1000)
+
+    converter = MCQConverter(deck_name, model_id=model_id, resolver=resolver)
+    futures, shards = [], []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(rows):
+            nonlocal next_id
+            number = len(futures) + 1
+            name = f"{deck_name}::Part {number:03d}"
+            path = os.path.join(output_dir, f"{stem}_part{number:03d}.apkg")
+            futures.append(pool.submit(write_shard, path, name, stable_id(name), model_id, rows,
+                                       timestamp, next_id, external_script, compresslevel))
+            shards.append({'file': os.path.basename(path), 'deck': name, 'notes': len(rows)})
+            next_id += 2 * len(rows)  # one note and one card ID per row
+            # Keep at most two shards per worker in flight so memory stays bounded
+            # (failures are collected below, so waiting must not raise)
+            pending = [f for f in futures if not f.done()]
+            if len(pending) >= 2 * workers:
+                wait(pending, return_when=FIRST_COMPLETED)
+
+        rows, size = [], 0
+        for fields, guid in converter.iter_note_fields(input_file):
+            row_size = sum(len(field.encode('utf-8')) for field in fields)
+            if rows and ((max_notes and len(rows) >= max_notes) or (max_bytes and size + row_size > max_bytes)):
+                submit(rows)
+                rows, size = [], 0
+            rows.append((fields, guid))
+            size += row_size
+        if rows:
+            submit(rows)
+
+        failed = 0
+        for shard, future in zip(shards, futures):
+            try:
+                shard.update(future.result())
+            except Exception as e:
+                shard['error'] = f"{type(e).__name__}: {e}"
+                failed += 1
+
+    manifest = {'deck': deck_name, 'timestamp': timestamp, 'failed': failed, 'shards': shards}
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def expand_inputs(pattern, extensions=('.txt',)):
+    """Return the sorted input files for a directory or glob pattern.
+
+    For a directory, only files with one of `extensions` are returned.
+    """
+    import glob
+
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(pattern, '*'))
+        paths = [path for path in paths if os.path.splitext(path)[1].lower() in extensions]
+    else:
+        paths = glob.glob(pattern)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def convert_batch(input_files, output, deck_name="Multiple Choice Questions", split=False, workers=None,
+                  dedupe=None, dedupe_report=None, external_script=False, compresslevel=None):
+    """Convert many export files, parsing them across a process pool.
+
+    With split=False all files go into one package at `output`, one
+    subdeck per file; otherwise `output` is a directory that receives one
+    .apkg per input. Deck and model IDs and the package timestamp are
+    derived from the inputs (or SOURCE_DATE_EPOCH), so rebuilding the same
+    files produces byte-identical packages. With a `dedupe` threshold,
+    duplicates are removed across all files before notes are built (see
+    remove_duplicates). Returns the written paths and the number of
+    duplicates merged (0 without `dedupe`).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import genanki
+
+    input_files = list(input_files)
+    if not input_files:
+        return [], 0
+    timestamp = float(os.environ.get('SOURCE_DATE_EPOCH')
+                      or max(int(os.path.getmtime(path)) for path in input_files))
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        # map() yields results in input order, whichever worker finishes first
+        results = pool.map(parse_export_file, input_files)
+        merged = 0
+        if dedupe is not None:
+            results = list(results)
+            kept, merged = remove_duplicates((mcq for mcqs in results for mcq in mcqs),
+                                             dedupe, dedupe_report)
+            # Split the kept records back up by file; first occurrences are kept, so order holds
+            kept = set(map(id, kept))
+            results = [[mcq for mcq in mcqs if id(mcq) in kept] for mcqs in results]
+
+        model_id = stable_id(MODEL_NAME)
+        if split:
+            os.makedirs(output, exist_ok=True)
+            written = []
+            # Every package gets its own range of note/card IDs so they can all be imported
+            next_id = int(timestamp * 1000)
+            for path, mcqs in zip(input_files, results):
+                stem = os.path.splitext(os.path.basename(path))[0]
+                name = f"{deck_name}::{stem}"
+                converter = MCQConverter(name, deck_id=stable_id(name), model_id=model_id,
+                                         external_script=external_script)
+                for mcq in mcqs:
+                    converter.deck.add_note(converter.build_note(mcq))
+                out_path = os.path.join(output, f"{stem}.apkg")
+                converter.save_deck(out_path, timestamp, compresslevel, first_id=next_id)
+                next_id += 2 * len(mcqs)  # one note and one card ID per question
+                written.append(out_path)
+            return written, merged
+
+        converter = MCQConverter(deck_name, deck_id=stable_id(deck_name), model_id=model_id,
+                                 external_script=external_script)
+        decks = []
+        for path, mcqs in zip(input_files, results):
+            name = f"{deck_name}::{os.path.splitext(os.path.basename(path))[0]}"
+            deck = genanki.Deck(stable_id(name), name)
+            for mcq in mcqs:
+                deck.add_note(converter.build_note(mcq))
+            decks.append(deck)
+        write_package(genanki.Package(decks, media_files=converter.media_files), output, timestamp,
+                      compresslevel)
+        return [output], merged
+
+def upsert_package(package_file, input_file, delete_missing=False, timestamp=None, resolver=None):
+    """Update an existing .apkg in place from an export.
+
+    Notes of the MCQ note type are matched to export rows by question_guid
+    of their question text, so only rows whose fields changed are rewritten;
+    the existing note keeps its ID, GUID, cards and review history. New
+    questions are inserted into the deck that already holds the MCQ cards,
+    and with delete_missing notes whose question is no longer in the export
+    are removed. All changes are made in one transaction, and the package
+    is replaced only once the updated one has been written. Answer keys are
+    fixed with `resolver` (an AnswerResolver) if given. Returns a dict of
+    inserted, updated, unchanged and deleted note counts.
+    """
+    import shutil
+    import sqlite3
+    import tempfile
+    import zipfile
+
+    if timestamp is None:
+        timestamp = time.time()
+    mod = int(timestamp)
+    workdir = tempfile.mkdtemp()
+    try:
+        with zipfile.ZipFile(package_file) as package:
+            names = package.namelist()
+            if 'collection.anki21' in names:
+                dbname = 'collection.anki21'
+            elif 'collection.anki2' in names:
+                dbname = 'collection.anki2'
+            else:
+                raise ValueError(f"{package_file} has no collection database this tool can update "
+                                 "(export it from Anki with support for older versions)")
+            dbfilename = package.extract(dbname, workdir)
+
+        conn = sqlite3.connect(dbfilename, isolation_level=None)
+        try:
+            models = json.loads(conn.execute('SELECT models FROM col').fetchone()[0])
+            model = next((m for m in models.values() if m['name'] == MODEL_NAME), None)
+            if model is None:
+                raise ValueError(f"{package_file} has no '{MODEL_NAME}' note type")
+            model_id = int(model['id'])
+            converter = MCQConverter(model_id=model_id, resolver=resolver)
+            if len(model['flds']) != len(converter.model.fields):
+                raise ValueError(f"{package_file}: '{MODEL_NAME}' has {len(model['flds'])} fields, "
+                                 f"expected {len(converter.model.fields)}")
+            # Newer Anki versions drop the cached card requirements from exported models
+            req = model.get('req') or converter.model._req
+            sort_index = model.get('sortf', 0)
+            row = conn.execute('SELECT cards.did FROM cards JOIN notes ON notes.id = cards.nid '
+                               'WHERE notes.mid = ? GROUP BY cards.did ORDER BY count(*) DESC LIMIT 1',
+                               (model_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"{package_file} has no '{MODEL_NAME}' notes to update")
+            deck_id = row[0]
+
+            existing = {}
+            for note_id, flds in conn.execute('SELECT id, flds FROM notes WHERE mid = ?', (model_id,)):
+                existing[question_guid(flds.split('\x1f'))] = (note_id, flds)
+            last_id = conn.execute('SELECT max(id) FROM (SELECT id FROM notes UNION ALL '
+                                   'SELECT id FROM cards)').fetchone()[0] or 0
+            ids = itertools.count(max(int(timestamp * 1000), last_id + 1))
+
+            seen = set()
+            notes, cards, updates = [], [], []
+            unchanged = 0
+            for fields, _ in converter.iter_note_fields(input_file):
+                guid = question_guid(fields)
+                if guid in seen:
+                    # Same question twice in the export: the first row wins
+                    continue
+                seen.add(guid)
+                match = existing.get(guid)
+                if match is None:
+                    note, note_cards = _note_rows(ids, guid, fields, model_id, fields[sort_index],
+                                                  req, deck_id, mod)
+                    notes.append(note)
+                    cards.extend(note_cards)
+                elif match[1] != '\x1f'.join(fields):
+                    updates.append(('\x1f'.join(fields), fields[sort_index], mod, match[0]))
+                else:
+                    unchanged += 1
+            deleted = [note_id for guid, (note_id, _) in existing.items()
+                       if delete_missing and guid not in seen]
+
+            conn.execute('BEGIN')
+            try:
+                conn.executemany('INSERT INTO notes VALUES(?,?,?,?,?,?,?,?,?,?,?)', notes)
+                conn.executemany('INSERT INTO cards VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', cards)
+                conn.executemany('UPDATE notes SET flds = ?, sfld = ?, mod = ?, usn = -1 WHERE id = ?',
+                                 updates)
+                for note_id in deleted:
+                    card_ids = [card_id for card_id, in
+                                conn.execute('SELECT id FROM cards WHERE nid = ?', (note_id,))]
+                    conn.executemany('INSERT INTO graves VALUES(-1, ?, 0)', [(i,) for i in card_ids])
+                    conn.execute('INSERT INTO graves VALUES(-1, ?, 1)', (note_id,))
+                    conn.execute('DELETE FROM cards WHERE nid = ?', (note_id,))
+                    conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+                conn.execute('UPDATE col SET mod = ?', (int(timestamp * 1000),))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+        # Copy every other entry (media, legacy collection stub) unchanged
+        tmp = package_file + '.tmp'
+        with zipfile.ZipFile(package_file) as src, zipfile.ZipFile(tmp, 'w') as dst:
+            for info in src.infolist():
+                if info.filename == dbname:
+                    info.date_time = time.gmtime(max(mod, 315532800))[:6]
+                    with open(dbfilename, 'rb') as db, dst.open(info, 'w') as out:
+                        shutil.copyfileobj(db, out)
+                else:
+                    dst.writestr(info, src.read(info))
+        os.replace(tmp, package_file)
+    finally:
+        shutil.rmtree(workdir)
+    return {'inserted': len(notes), 'updated': len(updates), 'unchanged': unchanged,
+            'deleted': len(deleted)}
+
+
+class ExportWatcher:
+    """Keep a package up to date with an export file that keeps growing.
+
+    The watcher remembers the byte offset just past the last complete line
+    it has processed and keeps the notes parsed so far in a NoteStore, so a
+    change only parses the appended tail before the package is rewritten.
+    A trailing line without a newline is left for the next change. If the
+    file shrinks or is replaced by a different file, it is parsed again
+    from the start. `compresslevel` is passed to every save_deck.
+    """
+
+    def __init__(self, input_file, output_file, deck_name="Multiple Choice Questions",
+                 external_script=False, compresslevel=None):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.deck_name = deck_name
+        self.external_script = external_script
+        self.compresslevel = compresslevel
+        self.reset()
+
+    def reset(self):
+        # Stable IDs so every rebuild re-imports as the same deck
+        self.converter = MCQConverter(self.deck_name, deck_id=stable_id(self.deck_name),
+                                      model_id=stable_id(MODEL_NAME),
+                                      external_script=self.external_script, compact=True)
+        self.offset = 0
+        self.identity = None
+
+    def update(self):
+        """Parse lines appended since the last update; return the number of new notes."""
+        st = os.stat(self.input_file)
+        identity = (st.st_dev, st.st_ino)
+        if identity != self.identity or st.st_size < self.offset:
+            self.reset()
+            self.identity = identity
+        with open(self.input_file, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return 0
+        self.offset += end
+        before = self.converter.note_count
+        text = io.StringIO(data[:end].decode('utf-8'))
+        for fields, guid in self.converter.iter_note_fields(text):
+            self.converter.store.add(fields, guid)
+        return self.converter.note_count - before
+
+    def rebuild(self):
+        """Rewrite the package, replacing the old one only once the new one is complete."""
+        tmp = self.output_file + '.tmp'
+        self.converter.save_deck(tmp, compresslevel=self.compresslevel)
+        os.replace(tmp, self.output_file)
+
+    def run(self, interval=0.5, debounce=1.0, report=print):
+        """Poll the export forever, rebuilding once writes have paused for `debounce` seconds."""
+        def build(saved_at):
+            start = time.perf_counter()
+            added = self.update()
+            self.rebuild()
+            done = time.perf_counter()
+            report(f"{added} new question(s), {self.converter.note_count} total: rebuilt "
+                   f"{self.output_file} in {done - start:.2f} s, "
+                   f"{time.time() - saved_at:.2f} s after save")
+
+        def signature():
+            try:
+                st = os.stat(self.input_file)
+            except FileNotFoundError:
+                # Editors that save atomically briefly remove the file
+                return None, None
+            return (st.st_ino, st.st_size, st.st_mtime_ns), st.st_mtime
+
+        seen, saved_at = signature()
+        build(saved_at)
+        changed_at = None
+        while True:
+            time.sleep(interval)
+            current, mtime = signature()
+            if current is not None and current != seen:
+                seen, saved_at, changed_at = current, mtime, time.monotonic()
+            if changed_at is not None and time.monotonic() - changed_at >= debounce:
+                changed_at = None
+                build(saved_at)
+
 
 def main():
     parser = argparse.ArgumentParser(description='Convert Anki export to MCQ deck')
-    parser.add_argument('input_file', help='Input text file (Anki export)')
-    parser.add_argument('output_file', help='Output .apkg file')
+    parser.add_argument('input_file', help='Input text file (Anki export), or - for stdin')
+    parser.add_argument('output_file', nargs='?', help='Output .apkg file, or - to write the package to stdout')
     parser.add_argument('--deck-name', default='Multiple Choice Questions',
                       help='Name for the Anki deck')
+    parser.add_argument('--external-script', action='store_true',
+                      help='Ship the card script once as a media file instead of inlining it in every card')
+    parser.add_argument('--compact', action='store_true',
+                      help='Keep notes in a compact columnar store instead of genanki objects '
+                           '(much less memory for very large decks)')
+    parser.add_argument('--watch', action='store_true',
+                      help='Keep running and rebuild the package whenever the export grows, '
+                           'parsing only the new lines')
+    parser.add_argument('--debounce', type=float, default=1.0, metavar='SECONDS',
+                      help='With --watch, wait until the export has been quiet this long before rebuilding')
+    parser.add_argument('--update', action='store_true',
+                      help='Update the existing output package in place: change edited questions, add new '
+                           'ones and keep review history')
+    parser.add_argument('--delete-missing', action='store_true',
+                      help='With --update, also remove notes whose question is no longer in the export')
+    parser.add_argument('--compression', type=int, choices=range(10), default=0, metavar='LEVEL',
+                      help='Zip compression level: 0 stores uncompressed (fastest, default), '
+                           '1-9 deflates (9 is smallest, for distribution)')
+    parser.add_argument('--scan', action='store_true',
+                      help='Validate a large export with a fast memory-mapped scan, list malformed line '
+                           'numbers and save a row offset index next to it')
+    parser.add_argument('--rows', type=parse_row_range, default=None, metavar='START:STOP',
+                      help='Only convert content rows START to STOP-1, seeking via the offset index '
+                           '(built on first use)')
+    parser.add_argument('--resolve-answers', action='store_true',
+                      help='Match answer keys that equal no option after normalizing entities, case and '
+                           'whitespace, letter keys, or by similarity, instead of marking the first option')
+    parser.add_argument('--answer-report', metavar='PATH',
+                      help='Write the low-confidence answer matches to a JSON file (implies --resolve-answers)')
+    parser.add_argument('--check', action='store_true',
+                      help='Only parse the input and report valid, skipped and unmatched-answer rows')
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='PATH',
+                      help='Reuse parsed lines from a SQLite cache (default: <output_file>.cache.sqlite)')
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                      help='Maximum number of cached lines before old entries are evicted')
+    parser.add_argument('--stream', action='store_true',
+                      help='Write notes straight into the package without holding the deck in memory')
+    parser.add_argument('--stats', choices=['text', 'json'],
+                      help='Print per-stage timings and row counters to stderr')
+    parser.add_argument('--ocr', action='store_true',
+                      help='Treat input_file as a directory or glob of scanned quiz pages and OCR them')
+    parser.add_argument('--dedupe', nargs='?', type=float, const=0.8, default=None, metavar='THRESHOLD',
+                      help='Merge exact and near-duplicate questions (similarity threshold, default 0.8)')
+    parser.add_argument('--dedupe-report', metavar='PATH',
+                      help='With --dedupe, write the merged clusters to this JSON file')
+    parser.add_argument('--shard-notes', type=int, default=None, metavar='N',
+                      help='Split the output into packages of at most N notes (output_file is a directory)')
+    parser.add_argument('--shard-bytes', type=parse_size, default=None, metavar='SIZE',
+                      help='Split the output into packages of at most SIZE bytes of note text, e.g. 50M')
+    parser.add_argument('--batch', action='store_true',
+                      help='Treat input_file as a directory or glob of exports')
+    parser.add_argument('--split', action='store_true',
+                      help='With --batch, write one .apkg per input into the output_file directory')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='With --batch, --ocr or sharding, number of worker processes (default: CPU count)')
     
+    parser.add_argument('--profile', metavar='PATH',
+                      help='Profile the run and write collapsed stacks (flamegraph.pl, speedscope) to PATH')
+    parser.add_argument('--profiler', choices=['sample', 'cprofile'], default='sample',
+                      help='With --profile, sample stacks every millisecond (low overhead, default) '
+                           'or trace every call with cProfile')
+    parser.add_argument('--profile-memory', nargs='?', type=int, const=10, default=None, metavar='TOP',
+                      help='Trace allocations and list the TOP (default 10) allocation sites of each '
+                           'convert and write step on stderr')
     args = parser.parse_args()
+
+    if args.profile:
+        from profiling import profile_call
+
+        profile_call(run, args.profile, args.profiler, args, parser)
+    else:
+        run(args, parser)
+
+
+def run(args, parser):
+    """Carry out the conversion requested by parsed command-line arguments."""
+    if args.check:
+        counts = check_export(args.input_file)
+        print(f"{counts['valid']} valid, {counts['skipped']} skipped, "
+              f"{counts['unmatched']} unmatched answers")
+        # Non-zero exit so pre-commit hooks fail on broken rows
+        sys.exit(1 if counts['skipped'] or counts['unmatched'] else 0)
+    if args.scan:
+        from export_index import default_index_path, scan_export
+
+        start = time.perf_counter()
+        index = scan_export(args.input_file)
+        elapsed = time.perf_counter() - start
+        index.save(default_index_path(args.input_file))
+        malformed = index.malformed_lines()
+        print(f"{index.valid_count} valid, {len(malformed)} malformed of {len(index)} rows "
+              f"({index.size / elapsed / 1e6:.0f} MB/s)")
+        if malformed:
+            shown = ', '.join(map(str, malformed[:20]))
+            print(f"Malformed lines: {shown}{', ...' if len(malformed) > 20 else ''}")
+        sys.exit(1 if malformed else 0)
+    if args.output_file is None:
+        parser.error('the following arguments are required: output_file')
+    source = args.input_file
+    is_document = args.input_file.lower().endswith(('.docx', '.html', '.htm'))
+    single_export = not (args.batch or args.ocr or args.watch or is_document)
+    first_row = 0
+    if args.rows:
+        if args.input_file == '-' or not single_export:
+            parser.error('--rows needs a single export file')
+        from export_index import load_or_scan
+
+        index = load_or_scan(args.input_file)
+        first_row = slice(*args.rows).indices(len(index))[0]
+        source = index.open_rows(args.input_file, *args.rows)
+    resolver = None
+    if args.resolve_answers or args.answer_report:
+        # Quiz documents and scans have no answer column to resolve
+        if not single_export:
+            parser.error('--resolve-answers and --answer-report need a single export file '
+                         '(not --batch, --watch, --ocr or a .docx/.html quiz)')
+        # Report row numbers count from the start of the export, not of the --rows range
+        resolver = AnswerResolver(row_offset=first_row)
+
+    def report_answers():
+        if resolver is not None:
+            print(resolver.summary())
+            if args.answer_report:
+                resolver.write_report(args.answer_report)
+    output = args.output_file
+    if output == '-':
+        if args.update or args.watch or args.batch or args.shard_notes or args.shard_bytes:
+            parser.error('only single-package conversions can write to stdout')
+        if args.cache == '':
+            parser.error('--cache needs a PATH when the package is written to stdout')
+        # The package owns stdout, so status messages go to stderr
+        output, sys.stdout = sys.stdout.buffer, sys.stderr
+
+    # Conversion modes other than the default single-export path, in the order they are tried
+    mode = next((name for name, active in (
+        ('--update', args.update), ('--watch', args.watch), ('a .docx/.html quiz', is_document),
+        ('--ocr', args.ocr), ('--batch', args.batch), ('--dedupe', args.dedupe is not None),
+        ('--shard-notes/--shard-bytes', args.shard_notes or args.shard_bytes)) if active), None)
+    if mode:
+        # (option, given, modes that honour it) for options only some paths support
+        unsupported = [option for option, given, modes in (
+            ('--stats', args.stats, ()),
+            ('--profile-memory', args.profile_memory, ()),
+            ('--cache', args.cache is not None, ()),
+            ('--stream', args.stream, ()),
+            ('--compact', args.compact, ('--watch', 'a .docx/.html quiz', '--ocr', '--dedupe')),
+        ) if given and mode not in modes]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be combined with {mode}")
+
+    if args.update:
+        counts = upsert_package(args.output_file, source, delete_missing=args.delete_missing,
+                                resolver=resolver)
+        print(f"Updated {args.output_file}: {counts['inserted']} inserted, {counts['updated']} updated, "
+              f"{counts['unchanged']} unchanged, {counts['deleted']} deleted")
+        report_answers()
+        return
+
+    if args.watch:
+        if args.input_file == '-':
+            parser.error('--watch needs an export file, not stdin')
+        watcher = ExportWatcher(args.input_file, args.output_file, args.deck_name,
+                                external_script=args.external_script, compresslevel=args.compression)
+        print(f"Watching {args.input_file} (Ctrl+C to stop)")
+        try:
+            watcher.run(interval=min(0.5, max(args.debounce, 0.05)), debounce=args.debounce)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if is_document:
+        from document_ingest import iter_document_records
+
+        converter = MCQConverter(deck_name=args.deck_name, external_script=args.external_script,
+                                 compact=args.compact)
+        converter.convert_records(iter_document_records(args.input_file))
+        converter.save_deck(output, compresslevel=args.compression)
+        print(f"Successfully created Anki deck: {args.output_file}")
+        return
+
+    if args.ocr:
+        from ocr_ingest import IMAGE_EXTENSIONS, ocr_pages
+
+        images = expand_inputs(args.input_file, IMAGE_EXTENSIONS)
+        if not images:
+            parser.error(f"no images match {args.input_file}")
+        start = time.perf_counter()
+        texts = ocr_pages(images, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        converter = MCQConverter(deck_name=args.deck_name, external_script=args.external_script,
+                                 compact=args.compact)
+        converter.convert_records(parse_quiz_blocks(line for text in texts for line in text.splitlines()))
+        converter.save_deck(output, compresslevel=args.compression)
+        print(f"OCR: {len(images)} pages in {elapsed:.1f} s ({len(images) / elapsed:.2f} pages/sec), "
+              f"{converter.note_count} questions")
+        print(f"Successfully created Anki deck: {args.output_file}")
+        return
+
+    if args.batch:
+        input_files = expand_inputs(args.input_file)
+        if not input_files:
+            parser.error(f"no export files match {args.input_file}")
+        written, merged = convert_batch(input_files, args.output_file, args.deck_name,
+                                        split=args.split, workers=args.workers,
+                                        dedupe=args.dedupe, dedupe_report=args.dedupe_report,
+                                        external_script=args.external_script,
+                                        compresslevel=args.compression)
+        if args.dedupe is not None:
+            print(f"Dedupe: merged {merged} duplicate question(s)")
+        print(f"Successfully created {len(written)} Anki deck(s) from {len(input_files)} file(s)")
+        return
     
-    converter = MCQConverter(deck_name=args.deck_name)
-    converter.convert_file(args.input_file)
-    converter.save_deck(args.output_file)
+    if args.dedupe is not None:
+        if args.shard_notes or args.shard_bytes:
+            parser.error('--dedupe cannot be combined with --shard-notes/--shard-bytes')
+        converter = MCQConverter(deck_name=args.deck_name, external_script=args.external_script,
+                                 compact=args.compact, resolver=resolver)
+        kept, merged = remove_duplicates(converter.iter_mcqs(source), args.dedupe,
+                                         args.dedupe_report)
+        converter.convert_records(kept)
+        converter.save_deck(output, compresslevel=args.compression)
+        print(f"Dedupe: merged {merged} duplicate question(s)")
+        report_answers()
+        print(f"Successfully created Anki deck: {args.output_file}")
+        return
+
+    if args.shard_notes or args.shard_bytes:
+        manifest = convert_sharded(source, args.output_file, args.deck_name,
+                                   max_notes=args.shard_notes, max_bytes=args.shard_bytes,
+                                   workers=args.workers, external_script=args.external_script,
+                                   compresslevel=args.compression, resolver=resolver)
+        print(f"Wrote {len(manifest['shards']) - manifest['failed']} shard(s) and manifest.json to "
+              f"{args.output_file}")
+        report_answers()
+        if manifest['failed']:
+            print(f"{manifest['failed']} shard(s) failed, see manifest.json", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    memory = None
+    if args.profile_memory:
+        from profiling import MemoryProfiler
+
+        memory = MemoryProfiler(args.profile_memory)
+    stats = ConversionStats(step_hooks=[memory.snapshot] if memory else ()) if args.stats or memory else None
+    if args.cache is not None:
+        # Stable IDs so the rebuilt deck is the same deck as far as Anki is concerned
+        converter = MCQConverter(deck_name=args.deck_name, deck_id=stable_id(args.deck_name),
+                                 model_id=stable_id(MODEL_NAME), stats=stats,
+                                 external_script=args.external_script, compact=args.compact,
+                                 resolver=resolver)
+        cache = ParseCache(args.cache or args.output_file + '.cache.sqlite', args.cache_size)
+    else:
+        converter = MCQConverter(deck_name=args.deck_name, stats=stats,
+                                 external_script=args.external_script, compact=args.compact,
+                                 resolver=resolver)
+        cache = None
+
+    if args.stream:
+        converter.convert_to_apkg(source, output, cache=cache, compresslevel=args.compression)
+    else:
+        converter.convert_file(source, cache=cache)
+        converter.save_deck(output, compresslevel=args.compression)
+    if cache is not None:
+        cache.close()
+        print(cache.report())
+        if stats is not None:
+            stats.count('cache_hits', cache.hits)
+            stats.count('cache_misses', cache.misses)
+    report_answers()
+    if stats is not None and args.stats:
+        print(json.dumps(stats.as_dict()) if args.stats == 'json' else stats.format(), file=sys.stderr)
+    if memory is not None:
+        print(memory.format(), file=sys.stderr)
     print(f"Successfully created Anki deck: {args.output_file}")
 
 if __name__ == '__main__':
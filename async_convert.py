@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Asyncio API for converting uploaded exports inside a web service.
+
+    async with AsyncConverter(max_workers=4) as converter:
+        package = await converter.convert(request_body_stream, deck_name='Cardiology')
+
+Parsing and packaging are CPU-bound, so they run in a bounded process pool
+and never block the event loop. Each worker builds the note model once
+(shared_model) and reuses it for every request. At most `max_pending`
+conversions are admitted at a time; further callers wait before their
+upload is read, so a saturated service stops pulling request bodies
+instead of buffering them. Cancelling a caller drops its job if a worker
+has not picked it up yet; a job that is already running finishes in the
+background and its slot is freed only then, so the bound always holds.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from anki_mcq_converter import MCQConverter, shared_model, stable_id
+
+CHUNK_SIZE = 1 << 16
+
+
+def convert_bytes(data, deck_name="Multiple Choice Questions", external_script=False,
+                  compresslevel=None):
+    """Convert the bytes of an export to the bytes of an .apkg (runs in a pool worker)."""
+    converter = MCQConverter(deck_name, deck_id=stable_id(deck_name), model=shared_model(external_script),
+                             external_script=external_script)
+    package = io.BytesIO()
+    # utf-8-sig drops the byte order mark some editors put in front of the #separator header
+    converter.convert_to_apkg(io.StringIO(data.decode('utf-8-sig')), package, compresslevel=compresslevel)
+    return package.getvalue()
+
+
+async def _chunks(source):
+    """Yield byte chunks from an async iterable or an object with an async read()."""
+    if hasattr(source, '__aiter__'):
+        async for chunk in source:
+            yield chunk
+    else:
+        while chunk := await source.read(CHUNK_SIZE):
+            yield chunk
+
+
+class AsyncConverter:
+    """Convert exports to packages from asyncio code with bounded concurrency."""
+
+    def __init__(self, max_workers=None, max_pending=None, max_upload_bytes=64 << 20,
+                 external_script=False, executor=None):
+        self.external_script = external_script
+        self.max_upload_bytes = max_upload_bytes
+        max_workers = max_workers or os.cpu_count()
+        # A caller's executor is theirs to shut down
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers, initializer=shared_model,
+                                           initargs=(external_script,))
+        self._executor = executor
+        # Admit a few more jobs than workers so a worker never waits for the next upload
+        self._max_pending = max_pending or 2 * max_workers
+        # Created on first use: before Python 3.10 a Semaphore binds to the event
+        # loop current at construction, which may not be the one serving requests
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the process pool, unless it was passed in as `executor`."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _read(self, source):
+        limit = self.max_upload_bytes
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            if len(source) > limit:
+                raise ValueError(f"upload exceeds {limit} bytes")
+            return bytes(source)
+        chunks, size = [], 0
+        async for chunk in _chunks(source):
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"upload exceeds {limit} bytes")
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    async def convert(self, source, deck_name="Multiple Choice Questions", compresslevel=None):
+        """Return the .apkg bytes for an export given as bytes or an async byte stream."""
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        await self._slots.acquire()
+        try:
+            data = await self._read(source)
+            future = self._executor.submit(convert_bytes, data, deck_name, self.external_script,
+                                           compresslevel)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(self._slots.release)
+            except RuntimeError:
+                pass  # the event loop has already been closed
+
+        # The slot stays taken until the worker is done, even if the caller gives up
+        future.add_done_callback(release)
+        # Cancelling the wrapper also cancels the job if it has not started yet
+        return await asyncio.wrap_future(future)
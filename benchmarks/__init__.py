@@ -0,0 +1,6 @@
+"""Throughput benchmarks for anki_mcq_converter.
+
+Run from the repository root:
+
+    python -m benchmarks.run --rows 1000 100000 1000000 --output bench.json
+"""
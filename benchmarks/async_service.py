@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Measure concurrent-request throughput of the asyncio conversion API.
+
+Starts a stand-in upload service on localhost (length-prefixed uploads over
+TCP, converted with async_convert.AsyncConverter) and drives it with local
+clients at increasing concurrency. Reports requests/sec, p50/p95 latency
+and the worst event-loop stall seen by a ticker task, next to a baseline
+of calling convert_bytes sequentially.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import struct
+import time
+
+from async_convert import AsyncConverter, convert_bytes
+from benchmarks.generate import make_row
+
+_LENGTH = struct.Struct('!Q')
+
+
+def make_export(rows, seed=0):
+    rng = random.Random(seed)
+    lines = ['#separator:tab', '#html:true'] + [make_row(rng) for _ in range(rows)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+async def body(reader, length):
+    """Yield an upload body straight off the socket, so backpressure reaches the client."""
+    while length:
+        chunk = await reader.read(min(length, 1 << 16))
+        if not chunk:
+            raise ConnectionError('client closed the connection mid-upload')
+        length -= len(chunk)
+        yield chunk
+
+
+async def serve(converter):
+    async def handle(reader, writer):
+        try:
+            (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+            package = await converter.convert(body(reader, length), deck_name='Upload')
+            writer.write(_LENGTH.pack(len(package)) + package)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+async def client(port, export):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(_LENGTH.pack(len(export)) + export)
+    await writer.drain()
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    await reader.readexactly(length)
+    writer.close()
+    return time.perf_counter() - start
+
+
+async def ticker(stalls, interval=0.005):
+    """Record how late the event loop wakes this task up."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(args, export):
+    async with AsyncConverter(max_workers=args.workers) as converter:
+        server = await serve(converter)
+        port = server.sockets[0].getsockname()[1]
+        await client(port, export)  # start the workers and build their models
+        for concurrency in args.concurrency:
+            stalls = []
+            tick = asyncio.create_task(ticker(stalls))
+            start = time.perf_counter()
+            latencies = []
+            for _ in range(0, args.requests, concurrency):
+                latencies += await asyncio.gather(*(client(port, export) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            tick.cancel()
+            latencies.sort()
+            print(f"concurrency {concurrency:3}: {len(latencies) / elapsed:7.1f} req/s, "
+                  f"p50 {statistics.median(latencies) * 1000:6.0f} ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.0f} ms, "
+                  f"max loop stall {max(stalls, default=0) * 1000:5.1f} ms")
+        server.close()
+        await server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the asyncio conversion API')
+    parser.add_argument('--rows', type=int, default=2000, help='Questions per upload')
+    parser.add_argument('--requests', type=int, default=64, help='Requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size')
+    args = parser.parse_args()
+
+    export = make_export(args.rows)
+    start = time.perf_counter()
+    for _ in range(min(args.requests, 8)):
+        convert_bytes(export, 'Upload')
+    baseline = min(args.requests, 8) / (time.perf_counter() - start)
+    print(f"{args.rows} questions per upload ({len(export) / 1e6:.2f} MB)")
+    print(f"sequential convert_bytes: {baseline:7.1f} req/s")
+    asyncio.run(run(args, export))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env node
+// Headless render harness for the MCQ card templates.
+//
+// Reads the JSON written by card_render.py: for each template mode, the
+// rendered front/back HTML of a set of cards plus any media files. Cards are
+// rendered one after another into a single reused "webview" (a vm context
+// with a minimal DOM, enough for the card script), the first option of each
+// front is clicked, and the time per card is reported. No npm packages are
+// needed.
+'use strict';
+const fs = require('fs');
+const vm = require('vm');
+
+const ENTITIES = { amp: '&', lt: '<', gt: '>', quot: '"', '#x27': "'", '#39': "'" };
+const decode = text => text.replace(/&(amp|lt|gt|quot|#x27|#39);/g, (_, e) => ENTITIES[e]);
+
+class Element {
+    constructor(doc, tagName) {
+        this.ownerDocument = doc;
+        this.tagName = tagName;
+        this.attributes = {};
+        this.childNodes = [];
+        this.parentNode = null;
+        this.style = {};
+        this.onclick = null;
+    }
+    get children() { return this.childNodes.filter(n => n instanceof Element); }
+    get className() { return this.attributes.class || ''; }
+    set className(value) { this.attributes.class = value; }
+    get id() { return this.attributes.id || ''; }
+    get src() { return this.attributes.src || ''; }
+    set src(value) { this.attributes.src = value; }
+    getAttribute(name) { return name in this.attributes ? this.attributes[name] : null; }
+    setAttribute(name, value) { this.attributes[name] = String(value); }
+    get textContent() {
+        return this.childNodes.map(n => typeof n === 'string' ? n : n.textContent).join('');
+    }
+    set textContent(value) { this.childNodes = [String(value)]; }
+    set innerHTML(value) {
+        if (value !== '') throw new Error('only innerHTML = "" is supported');
+        this.childNodes = [];
+    }
+    appendChild(child) {
+        child.parentNode = this;
+        this.childNodes.push(child);
+        if (child.tagName === 'script') this.ownerDocument.onScript(child);
+        return child;
+    }
+    remove() {
+        if (this.parentNode) {
+            this.parentNode.childNodes = this.parentNode.childNodes.filter(n => n !== this);
+            this.parentNode = null;
+        }
+    }
+    addEventListener() {}
+    *descendants() {
+        for (const child of this.children) {
+            yield child;
+            yield* child.descendants();
+        }
+    }
+    matches(selector) {
+        const m = /^(\w+)?(?:#([\w-]+))?(?:\.([\w-]+))?(?:\[([\w-]+)(?:="([^"]*)")?\])?$/.exec(selector);
+        if (!m) throw new Error('unsupported selector ' + selector);
+        const [, tag, id, cls, attr, value] = m;
+        return (!tag || this.tagName === tag) && (!id || this.id === id)
+            && (!cls || this.className.split(/\s+/).includes(cls))
+            && (!attr || (attr in this.attributes && (value === undefined || this.attributes[attr] === value)));
+    }
+    querySelectorAll(selector) {
+        const found = [];
+        for (const el of this.descendants()) if (el.matches(selector)) found.push(el);
+        return found;
+    }
+    querySelector(selector) { return this.querySelectorAll(selector)[0] || null; }
+}
+
+// Parse the small HTML subset the templates use
+function parse(doc, html, parent) {
+    const token = /<!--[\s\S]*?-->|<script([^>]*)>([\s\S]*?)<\/script>|<(\w+)([^>]*)>|<\/(\w+)>|([^<]+)/g;
+    const attrs = text => {
+        const result = {};
+        for (const [, name, value] of text.matchAll(/([\w-]+)(?:="([^"]*)")?/g)) result[name] = decode(value || '');
+        return result;
+    };
+    const stack = [parent];
+    let m;
+    while ((m = token.exec(html))) {
+        const top = stack[stack.length - 1];
+        if (m[2] !== undefined) {
+            const script = new Element(doc, 'script');
+            script.attributes = attrs(m[1]);
+            script.code = m[2];
+            script.parentNode = top;
+            top.childNodes.push(script);
+        } else if (m[3]) {
+            const el = new Element(doc, m[3].toLowerCase());
+            el.attributes = attrs(m[4]);
+            el.parentNode = top;
+            top.childNodes.push(el);
+            stack.push(el);
+        } else if (m[5]) {
+            stack.pop();
+        } else if (m[6] && m[6].trim()) {
+            top.childNodes.push(decode(m[6]));
+        }
+    }
+}
+
+function makeWebview(media) {
+    const compiled = {};
+    const pending = [];
+    const document = {
+        readyState: 'complete',
+        addEventListener() {},
+        createElement: tag => new Element(document, tag),
+        onScript: script => pending.push(script),
+    };
+    const window = { document, setTimeout() {}, btoa, unescape, encodeURIComponent, JSON, Math, Array, String, parseInt };
+    window.window = window;
+    const context = vm.createContext(window);
+
+    function runScripts() {
+        for (const script of document.body.querySelectorAll('script')) {
+            if (script.code !== undefined) new vm.Script(script.code).runInContext(context);
+        }
+        // Scripts added by the loader: the "browser" fetches and compiles each file once
+        while (pending.length) {
+            const script = pending.shift();
+            const name = script.src;
+            if (!(name in compiled)) compiled[name] = new vm.Script(media[name], { filename: name });
+            compiled[name].runInContext(context);
+            if (script.onload) script.onload();
+        }
+    }
+
+    return {
+        render(html) {
+            document.body = new Element(document, 'body');
+            document.getElementById = id => document.body.querySelector('#' + id);
+            document.querySelector = s => document.body.querySelector(s);
+            document.querySelectorAll = s => document.body.querySelectorAll(s);
+            parse(document, html, document.body);
+            runScripts();
+            return document;
+        },
+    };
+}
+
+function run(mode) {
+    const webview = makeWebview(mode.media);
+    const problems = [];
+    const start = process.hrtime.bigint();
+    mode.cards.forEach((card, i) => {
+        let doc = webview.render(card.front);
+        const options = doc.querySelectorAll('.option-wrapper');
+        if (options.length !== 4) problems.push(`card ${i}: front shows ${options.length} options`);
+        else options[0].onclick();
+        doc = webview.render(card.back);
+        if (doc.querySelectorAll('.correct').length !== 1) problems.push(`card ${i}: back highlights no single answer`);
+    });
+    const elapsed = Number(process.hrtime.bigint() - start) / 1e3;
+    return { usPerCard: elapsed / mode.cards.length, cards: mode.cards.length, problems: problems.slice(0, 5) };
+}
+
+const data = JSON.parse(fs.readFileSync(process.argv[2], 'utf8'));
+const results = {};
+for (const [name, mode] of Object.entries(data)) {
+    run(mode);  // warm up the JIT
+    results[name] = run(mode);
+}
+console.log(JSON.stringify(results));
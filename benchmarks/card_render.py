@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure per-card render time of the inline and external card script.
+
+Renders the model templates for synthetic notes the way Anki does (field
+substitution and {{#Field}} sections), then runs benchmarks/card_render.js
+under node, which renders each card's front and back in one reused
+context, clicks an option and reports microseconds per card. Requires
+node on PATH, no npm packages.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+
+from benchmarks.generate import make_row
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def render_template(template, fields):
+    """Minimal Anki template rendering: sections, then field substitution."""
+    def section(match):
+        return match.group(2) if fields.get(match.group(1)) else ''
+    template = re.sub(r'{{#([^}]+)}}(.*?){{/\1}}', section, template, flags=re.DOTALL)
+    return re.sub(r'{{([^#/}][^}]*)}}', lambda m: fields.get(m.group(1), ''), template)
+
+
+def build_mode(external_script, records):
+    from anki_mcq_converter import MCQConverter
+
+    converter = MCQConverter(external_script=external_script)
+    template = converter.model.templates[0]
+    names = [field['name'] for field in converter.model.fields]
+    cards = []
+    for mcq in records:
+        fields = dict(zip(names, converter.note_fields(mcq)))
+        cards.append({'front': render_template(template['qfmt'], fields),
+                      'back': render_template(template['afmt'], fields)})
+    media = {name: data.decode('utf-8') for name, data in converter.media_files}
+    return {'cards': cards, 'media': media, 'template_bytes': len(template['qfmt']) + len(template['afmt'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark card rendering')
+    parser.add_argument('--cards', type=int, default=2000, help='Number of cards to render per mode')
+    args = parser.parse_args()
+
+    from anki_mcq_converter import parse_mcq_record
+
+    rng = random.Random(0)
+    records = []
+    while len(records) < args.cards:
+        mcq = parse_mcq_record(make_row(rng, malformed_rate=0))
+        if mcq:
+            records.append(mcq)
+
+    modes = {'inline': build_mode(False, records), 'external': build_mode(True, records)}
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(modes, f)
+    try:
+        proc = subprocess.run(['node', os.path.join(HERE, 'card_render.js'), f.name],
+                              capture_output=True, text=True, check=True)
+    finally:
+        os.remove(f.name)
+
+    results = json.loads(proc.stdout)
+    for name, result in results.items():
+        print(f"{name:<9} {result['usPerCard']:8.1f} us/card  "
+              f"templates {modes[name]['template_bytes']:>6} bytes  ({result['cards']} cards)")
+        for problem in result['problems']:
+            print(f"  {problem}")
+    print(f"speed-up: x{results['inline']['usPerCard'] / results['external']['usPerCard']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
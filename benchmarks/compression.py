@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Measure save_deck throughput and package size per compression level.
+
+Converts a synthetic export once, then saves it at each level into an
+in-memory buffer (so disk speed does not skew the numbers) and reports
+the write time, the package size and the throughput in MB/s of
+uncompressed package content.
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from anki_mcq_converter import MCQConverter
+from benchmarks.generate import generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure save_deck speed and size per compression level')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the synthetic export')
+    parser.add_argument('--levels', type=int, nargs='+', default=[0, 1, 6, 9],
+                        help='Compression levels to measure')
+    parser.add_argument('--repeat', type=int, default=3, help='Saves per level')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.txt')
+        generate(path, args.rows)
+        converter = MCQConverter('Benchmark', deck_id=1, model_id=2, compact=True)
+        converter.convert_file(path)
+
+    # Uncompressed content size, from a stored package
+    stored = io.BytesIO()
+    converter.save_deck(stored, timestamp=1700000000.0, compresslevel=0)
+    raw_size = len(stored.getvalue())
+
+    for level in args.levels:
+        times = []
+        for _ in range(args.repeat):
+            buf = io.BytesIO()
+            start = time.perf_counter()
+            converter.save_deck(buf, timestamp=1700000000.0, compresslevel=level)
+            times.append(time.perf_counter() - start)
+        size = len(buf.getvalue())
+        seconds = statistics.median(times)
+        print(f"level {level}: {size / 1e6:8.2f} MB ({size / raw_size:6.1%}), "
+              f"{seconds:.2f} s, {raw_size / seconds / 1e6:7.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
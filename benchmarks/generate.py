@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Generate synthetic Anki exports shaped like gastro_sample.txt."""
+import argparse
+import random
+
+WORDS = [
+    'hypertension', 'thyroid', 'renal', 'artery', 'stenosis', 'insulin', 'cortisol',
+    'hepatic', 'folate', 'methionine', 'ovarian', 'syndrome', 'chronic', 'acute',
+    'primary', 'secondary', 'deficiency', 'excess', 'tumor', 'infection',
+    'Ménétrier', 'Sjögren', 'Crohn', 'β-blocker', 'α-agonist', 'café-au-lait',
+    'μg/dL', '≥ 140 mmHg', 'naïve', 'Hashimoto',
+]
+STEMS = [
+    'Top cause of', 'Not a common finding in', 'Diagnostic criteria for',
+    'Most directly contributes to', 'First-line treatment of', 'A metabolite of',
+]
+
+
+def phrase(rng, lo=1, hi=4):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi)))
+
+
+def make_row(rng, malformed_rate=0.02):
+    """Return one export line (without newline)."""
+    options = [phrase(rng).capitalize() for _ in range(rng.choice((4, 4, 4, 5)))]
+    correct = rng.choice(options)
+    # Exports often leave a space before <br>
+    parts = [opt + (' ' if rng.random() < 0.1 else '') for opt in options]
+    question = f"{rng.choice(STEMS)} {phrase(rng, 1, 3)}:"
+    row = f"{question}<br><br>{'<br>'.join(parts)}\t{correct}"
+
+    if rng.random() < malformed_rate:
+        kind = rng.randrange(3)
+        if kind == 0:
+            row = row.replace('\t', ' ')                     # no answer column
+        elif kind == 1:
+            row = f"{question}<br>{parts[0]}<br>{parts[1]}\t{correct}"  # too few options
+        else:
+            row += '\textra'                                  # extra column
+    return row
+
+
+def generate(path, rows, seed=0, malformed_rate=0.02):
+    """Write an export with `rows` question lines to `path`."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#separator:tab\n#html:true\n')
+        for _ in range(rows):
+            f.write(make_row(rng, malformed_rate))
+            f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Anki MCQ export')
+    parser.add_argument('output_file', help='Output text file')
+    parser.add_argument('--rows', type=int, default=1000, help='Number of question rows')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--malformed-rate', type=float, default=0.02,
+                        help='Fraction of rows that should fail to parse')
+    args = parser.parse_args()
+    generate(args.output_file, args.rows, args.seed, args.malformed_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Compare the memory per card of genanki notes and the compact NoteStore.
+
+Converts the same synthetic export with MCQConverter(compact=False) and
+MCQConverter(compact=True) and reports the bytes allocated per card
+(tracemalloc) and the time taken to convert and to write the package.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from anki_mcq_converter import MCQConverter
+from benchmarks.generate import generate
+
+
+def measure(path, compact, output):
+    tracemalloc.start()
+    start = time.perf_counter()
+    converter = MCQConverter('Benchmark', compact=compact)
+    converter.convert_file(path)
+    convert_s = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    converter.save_deck(output)
+    write_s = time.perf_counter() - start
+    return converter.note_count, held, convert_s, write_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure note memory with and without --compact')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the synthetic export')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.txt')
+        generate(path, args.rows)
+        results = {}
+        for label, compact in (('genanki', False), ('compact', True)):
+            cards, held, convert_s, write_s = measure(path, compact, os.path.join(tmp, label + '.apkg'))
+            results[label] = held / cards
+            print(f"{label:8} {cards} cards: {held / cards:7.0f} B/card, "
+                  f"convert {convert_s:.2f} s, write {write_s:.2f} s")
+    print(f"compact store uses {results['genanki'] / results['compact']:.1f}x less memory per card")
+
+
+if __name__ == '__main__':
+    main()
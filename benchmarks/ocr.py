@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Render synthetic quiz pages and measure OCR ingestion throughput.
+
+Needs the OCR dependencies and a tesseract binary on PATH. Each page is
+rendered with OpenCV, slightly rotated and noised, then run through
+ocr_ingest.ocr_pages and parse_quiz_blocks; pages/sec and the number of
+recovered questions are reported.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.generate import phrase
+
+QUESTIONS_PER_PAGE = 4
+
+
+def quiz_lines(rng, first_number):
+    lines = []
+    for n in range(first_number, first_number + QUESTIONS_PER_PAGE):
+        correct = rng.randrange(4)
+        lines.append(f"Q{n}: {phrase(rng, 3, 5).capitalize()}?")
+        for i, letter in enumerate('ABCD'):
+            text = phrase(rng, 1, 3).capitalize()
+            lines.append(f"{letter}) **{text}**" if i == correct else f"{letter}) {text}")
+        lines.append('')
+    return lines
+
+
+def render_page(lines, path, rng, angle=None):
+    """Render text lines onto a white page, rotate it slightly and add noise."""
+    page = np.full((1400, 1000), 255, np.uint8)
+    y = 60
+    for line in lines:
+        # Hershey fonts are ASCII only
+        cv2.putText(page, line.encode('ascii', 'replace').decode(), (50, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2, cv2.LINE_AA)
+        y += 40
+    angle = rng.uniform(-3, 3) if angle is None else angle
+    matrix = cv2.getRotationMatrix2D((500, 700), angle, 1.0)
+    page = cv2.warpAffine(page, matrix, (1000, 1400), borderValue=255)
+    noise = np.random.default_rng(rng.randrange(1 << 30)).normal(0, 12, page.shape)
+    cv2.imwrite(path, np.clip(page + noise, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OCR ingestion')
+    parser.add_argument('--pages', type=int, default=16, help='Number of pages to render')
+    parser.add_argument('--workers', type=int, default=None, help='OCR worker processes')
+    args = parser.parse_args()
+
+    from anki_mcq_converter import parse_quiz_blocks
+    from ocr_ingest import ocr_pages
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for page in range(args.pages):
+            path = os.path.join(workdir, f'page_{page:04d}.png')
+            render_page(quiz_lines(rng, page * QUESTIONS_PER_PAGE + 1), path, rng)
+            paths.append(path)
+
+        start = time.perf_counter()
+        texts = ocr_pages(paths, workers=args.workers)
+        elapsed = time.perf_counter() - start
+
+    records = list(parse_quiz_blocks(line for text in texts for line in text.splitlines()))
+    expected = args.pages * QUESTIONS_PER_PAGE
+    print(f"{args.pages} pages in {elapsed:.2f} s ({args.pages / elapsed:.2f} pages/sec), "
+          f"{len(records)}/{expected} questions recovered")
+
+
+if __name__ == '__main__':
+    main()
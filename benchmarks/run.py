@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Time parse_mcq_line, convert_file and save_deck on synthetic exports.
+
+The fast-path parse_mcq_record is timed alongside parse_mcq_line and both
+parsers are checked to agree on every generated line, as is the byte-level
+export scanner (on the generated export and on SCANNER_CASES). iter_mcqs
+is timed with and without an AnswerResolver to show the cost of answer
+resolution.
+
+Each size runs in a fresh process so peak RSS is not inflated by the
+previous run. Results are written as JSON; pass --compare with an earlier
+result file to print the change in lines/sec.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import generate
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+
+def check_parsers(lines):
+    """Raise AssertionError if parse_mcq_record disagrees with parse_mcq_line."""
+    from anki_mcq_converter import MCQConverter, parse_mcq_record
+
+    for lineno, line in enumerate(lines, 1):
+        expected = MCQConverter.parse_mcq_line(line)
+        record = parse_mcq_record(line)
+        actual = record._asdict() if record else None
+        assert actual == expected, f"parsers disagree on line {lineno}: {expected!r} != {actual!r}"
+
+
+# Rows the byte-level scanner has to classify exactly like the parser
+SCANNER_CASES = [
+    'Q<br>a<br>b<br>c<br>d\ta',
+    'Q<br>a<br>b<br>c<br>d\t',                        # empty answer column
+    '\tQ<br>a<br>b<br>c<br>d',                        # leading tab is stripped
+    'Q<br>a<br>\u00a0<br>c<br>d\ta',                  # no-break space only part
+    '\u00a0',                                          # no-break space only line
+    '\u3000Q<br>a<br>b<br>c<br>d\u2003\ta',
+    '  #not a header<br>a<br>b<br>c<br>d\ta',
+    '#separator:tab',
+    ' \t ',
+    'Q<br>a<br>b<br> <br>d<br>e\ta',
+    'Q<br>a<br>b<br>c<br>d\ta\tb',
+    'Q<br>a<br>b<br>c<br>d\ta<br>b',
+    'Q<br>a<br>b<br>c\rd<br>e<br>f<br>g<br>h\te',     # lone CR ends the line
+    'Q<br>a<br>b<br>c<br>d\ta\r',
+    'Ménétrier<br>β<br>≥ 140<br>naïve<br>μg\tβ',
+]
+
+
+def check_scanner(path):
+    """Raise AssertionError if scan_export disagrees with read_export_lines + parse_mcq_record."""
+    from anki_mcq_converter import parse_mcq_record, read_export_lines
+    from export_index import scan_export
+
+    lines = list(read_export_lines(path))
+    index = scan_export(path)
+    assert len(index) == len(lines), f"scanner found {len(index)} rows, parser {len(lines)}"
+    for row, (line, valid) in enumerate(zip(lines, index.valid.tolist())):
+        expected = parse_mcq_record(line) is not None
+        assert valid == expected, f"scanner disagrees on row {row} (line {index.lines[row]}): {line!r}"
+    for start, stop in index.split(min(len(index), 64)):
+        assert list(index.iter_lines(path, start, stop)) == lines[start:stop], \
+            f"open_rows({start}, {stop}) does not match the parser rows"
+
+
+def bench_size(rows, workdir):
+    from anki_mcq_converter import AnswerResolver, MCQConverter, parse_mcq_record, read_export_lines
+
+    export = os.path.join(workdir, f'export_{rows}.txt')
+    output = os.path.join(workdir, f'deck_{rows}.apkg')
+    generate(export, rows)
+    result = {'rows': rows, 'input_bytes': os.path.getsize(export)}
+
+    lines = list(read_export_lines(export))
+    start = time.perf_counter()
+    parsed = sum(1 for line in lines if MCQConverter.parse_mcq_line(line))
+    elapsed = time.perf_counter() - start
+    result['parse_mcq_line'] = {'seconds': elapsed, 'lines_per_sec': len(lines) / elapsed,
+                                'valid': parsed}
+
+    start = time.perf_counter()
+    sum(1 for line in lines if parse_mcq_record(line))
+    elapsed = time.perf_counter() - start
+    result['parse_mcq_record'] = {'seconds': elapsed, 'lines_per_sec': len(lines) / elapsed,
+                                  'speedup': result['parse_mcq_line']['seconds'] / elapsed}
+    check_parsers(lines)
+    check_scanner(export)
+    edge_cases = os.path.join(workdir, 'scanner_cases.txt')
+    with open(edge_cases, 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(SCANNER_CASES * 3) + '\n')
+    check_scanner(edge_cases)
+
+    from dedupe import find_duplicates
+    records = [mcq for mcq in map(parse_mcq_record, lines) if mcq]
+    start = time.perf_counter()
+    merged = find_duplicates(records).merged
+    elapsed = time.perf_counter() - start
+    result['find_duplicates'] = {'seconds': elapsed, 'records_per_sec': len(records) / elapsed,
+                                 'merged': merged}
+    del lines, records
+
+    resolver = AnswerResolver()
+    # Built first: the first MCQConverter also pays for importing genanki
+    converters = (('iter_mcqs', MCQConverter()), ('resolve_answers', MCQConverter(resolver=resolver)))
+    for stage, converter in converters:
+        start = time.perf_counter()
+        sum(1 for _ in converter.iter_mcqs(export))
+        elapsed = time.perf_counter() - start
+        result[stage] = {'seconds': elapsed, 'lines_per_sec': rows / elapsed}
+    result['resolve_answers'].update(resolver.counts)
+    del converters
+
+    converter = MCQConverter()
+    start = time.perf_counter()
+    converter.convert_file(export)
+    elapsed = time.perf_counter() - start
+    result['convert_file'] = {'seconds': elapsed, 'lines_per_sec': rows / elapsed}
+
+    start = time.perf_counter()
+    converter.save_deck(output)
+    elapsed = time.perf_counter() - start
+    result['save_deck'] = {'seconds': elapsed, 'notes_per_sec': parsed / elapsed}
+
+    result['output_bytes'] = os.path.getsize(output)
+    del converter
+
+    start = time.perf_counter()
+    MCQConverter().convert_to_apkg(export, output)
+    elapsed = time.perf_counter() - start
+    result['convert_to_apkg'] = {'seconds': elapsed, 'lines_per_sec': rows / elapsed}
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+STAGES = (('parse_mcq_line', 'lines_per_sec'), ('parse_mcq_record', 'lines_per_sec'),
+          ('convert_file', 'lines_per_sec'), ('save_deck', 'notes_per_sec'),
+          ('convert_to_apkg', 'lines_per_sec'), ('find_duplicates', 'records_per_sec'),
+          ('iter_mcqs', 'lines_per_sec'), ('resolve_answers', 'lines_per_sec'))
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r['rows']: r for r in json.load(f)['results']}
+    for r in results:
+        old = baseline.get(r['rows'])
+        if not old:
+            continue
+        for stage, key in STAGES:
+            if stage in r and stage in old:
+                change = r[stage][key] / old[stage][key] - 1
+                print(f"{r['rows']:>9} rows  {stage:<16} {change:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark anki_mcq_converter')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Export sizes to benchmark')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    parser.add_argument('--compare', metavar='JSON', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            with ctx.Pool(1) as pool:
+                r = pool.apply(bench_size, (rows, workdir))
+            results.append(r)
+            print(f"{rows:>9} rows  parse {r['parse_mcq_line']['lines_per_sec']:>10.0f} lines/s  "
+                  f"fast x{r['parse_mcq_record']['speedup']:.2f}  "
+                  f"convert {r['convert_file']['lines_per_sec']:>9.0f} lines/s  "
+                  f"save {r['save_deck']['seconds']:>7.2f} s  "
+                  f"stream {r['convert_to_apkg']['lines_per_sec']:>9.0f} lines/s  "
+                  f"dedupe {r['find_duplicates']['records_per_sec']:>8.0f} rec/s  "
+                  f"resolve x{r['resolve_answers']['lines_per_sec'] / r['iter_mcqs']['lines_per_sec']:.2f}  "
+                  f"rss {r['peak_rss_mb']:>7.1f} MB  out {r['output_bytes'] / 1e6:.1f} MB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'revision': git_revision(), 'python': platform.python_version(),
+                   'timestamp': time.time(), 'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
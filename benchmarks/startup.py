@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Measure CLI startup cost and enforce an import-time budget.
+
+Reports the cumulative `python -X importtime` cost of importing
+anki_mcq_converter and the wall time of `--check` on gastro_sample.txt.
+Exits non-zero if the import exceeds the budget or pulls in genanki.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_cost_us():
+    """Return (cumulative import microseconds, imported module names)."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import anki_mcq_converter'],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    modules, total = set(), None
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = (field.strip() for field in line[len('import time:'):].split('|'))
+        if cumulative.isdigit():
+            modules.add(name)
+            if name == 'anki_mcq_converter':
+                total = int(cumulative)
+    return total, modules
+
+
+def check_wall_ms():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'anki_mcq_converter.py', '--check', 'gastro_sample.txt'],
+                   cwd=ROOT, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure anki_mcq_converter startup time')
+    parser.add_argument('--budget-ms', type=float, default=50.0,
+                        help='Maximum median import time of anki_mcq_converter')
+    parser.add_argument('--repeat', type=int, default=7, help='Number of measurements')
+    args = parser.parse_args()
+
+    import_cost_us()  # warm the bytecode cache
+    samples, modules = [], set()
+    for _ in range(args.repeat):
+        total, modules = import_cost_us()
+        samples.append(total / 1000)
+    import_ms = statistics.median(samples)
+    check_ms = statistics.median(check_wall_ms() for _ in range(args.repeat))
+    print(f"import anki_mcq_converter: {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"--check gastro_sample.txt: {check_ms:.1f} ms wall")
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"import time {import_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    heavy = sorted(name for name in modules if name.split('.')[0] in ('genanki', 'sqlite3', 'zipfile'))
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
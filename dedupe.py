@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Exact and near-duplicate detection for parsed MCQs.
+
+Questions are normalized (HTML stripped, case-folded, punctuation removed,
+options sorted so reordering does not matter). Exact duplicates are found
+by hashing the normalized text. The rest are MinHashed over word and
+word-pair shingles, a chunk of records at a time, and grouped with
+locality-sensitive hashing: each band of the
+signature is hashed, rows are sorted by band hash, and rows sharing a
+bucket are compared with the first row of that bucket. Everything is done
+in whole-array NumPy operations, so the cost grows roughly linearly with
+the number of questions instead of with the number of pairs.
+"""
+import hashlib
+import html
+import re
+import zlib
+
+import numpy as np
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+_SHIFT = np.uint64(32)
+
+
+def normalize_text(text):
+    return ' '.join(_NON_WORD_RE.sub(' ', html.unescape(_TAG_RE.sub(' ', text)).casefold()).split())
+
+
+def normalized_mcq(mcq):
+    """Normalized question and options, independent of option order."""
+    return normalize_text(mcq.question) + ' | ' + ' | '.join(sorted(map(normalize_text, mcq.options)))
+
+
+def lsh_params(threshold, num_perm):
+    """Pick (bands, rows) whose LSH threshold (1/b)**(1/r) is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def shingles(text):
+    """CRC32s of the words and adjacent word pairs of normalized text."""
+    words = text.split()
+    crc = zlib.crc32
+    return ([crc(word.encode('utf-8')) for word in words]
+            + [crc(f"{a} {b}".encode('utf-8')) for a, b in zip(words, words[1:])]) or [0]
+
+
+class MinHasher:
+    """MinHash signatures using multiply-shift hashing, num_perm values per text."""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = (rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1))[:, None]
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)[:, None]
+
+    def signatures(self, texts):
+        """Return a (len(texts), num_perm) uint32 array for a chunk of texts."""
+        sets = [shingles(text) for text in texts]
+        lengths = np.fromiter(map(len, sets), np.int64, len(sets))
+        flat = np.fromiter((value for values in sets for value in values), np.uint64, int(lengths.sum()))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # uint64 products wrap around; the high 32 bits are the hash
+        hashes = ((self.a * flat + self.b) >> _SHIFT).astype(np.uint32)
+        return np.minimum.reduceat(hashes, starts, axis=1).T
+
+
+class DuplicateClusters:
+    """Result of find_duplicates.
+
+    `keep[i]` is False for records merged into an earlier one, and
+    `clusters` maps each kept record's index to the indices merged into it
+    (with the kind of match: 'exact' or 'near' plus the estimated similarity).
+    """
+
+    def __init__(self, count):
+        self.keep = np.ones(count, dtype=bool)
+        self.clusters = {}
+
+    def merge(self, representative, duplicate, kind, similarity=1.0):
+        self.keep[duplicate] = False
+        self.clusters.setdefault(representative, []).append((duplicate, kind, similarity))
+
+    @property
+    def merged(self):
+        return int((~self.keep).sum())
+
+    def report(self, records):
+        """Return the merged clusters as JSON-serializable dicts."""
+        return [{
+            'kept': {'index': rep, 'question': records[rep].question},
+            'merged': [{'index': dup, 'question': records[dup].question, 'match': kind,
+                        'similarity': round(similarity, 3)} for dup, kind, similarity in sorted(dups)],
+        } for rep, dups in sorted(self.clusters.items())]
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def find_duplicates(records, threshold=0.8, num_perm=64, chunk_size=1024):
+    """Find exact and near duplicates among MCQRecords; the first occurrence is kept.
+
+    `threshold` is the estimated Jaccard similarity of the normalized
+    question+options text above which two records are merged; 1.0 merges
+    exact duplicates only.
+    """
+    result = DuplicateClusters(len(records))
+
+    # Exact duplicates: 8-byte digest of the normalized text
+    first_seen, texts, candidates, exact = {}, [], [], []
+    for i, mcq in enumerate(records):
+        text = normalized_mcq(mcq)
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+        first = first_seen.setdefault(digest, i)
+        if first != i:
+            exact.append((first, i))
+        elif threshold < 1.0:
+            texts.append(text)
+            candidates.append(i)
+    # Exact copies follow their first occurrence if that is near-merged in turn
+    near = {}
+    if len(candidates) >= 2:
+        near = _near_duplicates(result, texts, candidates, threshold, num_perm, chunk_size)
+    for first, i in exact:
+        if first in near:
+            root, similarity = near[first]
+            result.merge(root, i, 'near', similarity)
+        else:
+            result.merge(first, i, 'exact')
+    return result
+
+
+def _near_duplicates(result, texts, candidates, threshold, num_perm, chunk_size):
+    """Merge near duplicates among the unique records into `result`.
+
+    Returns {merged record index: (kept record index, similarity)}.
+    """
+    # Near duplicates among the remaining unique records
+    hasher = MinHasher(num_perm)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), chunk_size):
+        signatures[start:start + chunk_size] = hasher.signatures(texts[start:start + chunk_size])
+    del texts
+
+    bands, rows = lsh_params(threshold, num_perm)
+    mixers = np.random.default_rng(2).integers(1, 1 << 63, rows, dtype=np.uint64) | np.uint64(1)
+    positions = np.arange(len(candidates))
+    parent = list(range(len(candidates)))
+    for band in range(bands):
+        band_sig = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (band_sig * mixers).sum(axis=1)  # uint64 arithmetic wraps, which is fine for hashing
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.empty(len(order), dtype=bool)
+        starts[0] = True
+        starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        # The stable sort puts the earliest record of each bucket first
+        bucket_first = order[np.maximum.accumulate(np.where(starts, positions, 0))]
+        members = ~starts
+        if not members.any():
+            continue
+        a, b = bucket_first[members], order[members]
+        similar = (signatures[a] == signatures[b]).mean(axis=1) >= threshold
+        for x, y in zip(a[similar].tolist(), b[similar].tolist()):
+            rx, ry = _find(parent, x), _find(parent, y)
+            if rx != ry:
+                parent[max(rx, ry)] = min(rx, ry)
+
+    near = {}
+    for row in range(len(candidates)):
+        root = _find(parent, row)
+        if root != row:
+            similarity = float((signatures[root] == signatures[row]).mean())
+            result.merge(candidates[root], candidates[row], 'near', similarity)
+            near[candidates[row]] = (candidates[root], similarity)
+    return near
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Streaming DOCX and HTML quiz ingestion.
+
+Both importers walk the document one paragraph (or block element) at a
+time with lxml's iterparse, clearing each element once its text has been
+taken, so memory stays bounded on documents with thousands of pages. The
+text lines are parsed with anki_mcq_converter.parse_quiz_blocks, which
+yields the same MCQRecords as parse_mcq_record. Bold text is turned into
+the README's **correct** marker.
+
+python-docx's Document() loads the whole document part into memory, so
+word/document.xml is read straight from the .docx zip instead; python-docx
+is only used for its namespace helper.
+"""
+import zipfile
+
+from docx.oxml.ns import qn
+from lxml import etree
+
+from anki_mcq_converter import parse_quiz_blocks
+
+# HTML elements whose text forms one or more lines of the quiz
+# (containers such as ol or table are listed so emitted ones can be freed)
+HTML_BLOCK_TAGS = ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'td', 'dt', 'dd', 'pre',
+                   'div', 'body', 'ol', 'ul', 'dl', 'table', 'tbody', 'tr', 'blockquote',
+                   'section', 'article')
+
+_W_P, _W_R, _W_T, _W_TAB, _W_BR = qn('w:p'), qn('w:r'), qn('w:t'), qn('w:tab'), qn('w:br')
+_W_RPR, _W_B, _W_VAL = qn('w:rPr'), qn('w:b'), qn('w:val')
+
+
+def _release(element):
+    """Free an element that has been processed, along with earlier siblings."""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _is_bold(run):
+    rpr = run.find(_W_RPR)
+    bold = rpr.find(_W_B) if rpr is not None else None
+    return bold is not None and bold.get(_W_VAL) not in ('0', 'false')
+
+
+def _docx_paragraph_text(paragraph):
+    """Join a paragraph's runs, wrapping bold stretches in **."""
+    segments = []
+    for run in paragraph.iter(_W_R):
+        text = ''.join(node.text or '' if node.tag == _W_T else '\t' if node.tag == _W_TAB else '\n'
+                       for node in run if node.tag in (_W_T, _W_TAB, _W_BR))
+        if not text:
+            continue
+        bold = _is_bold(run)
+        if segments and segments[-1][1] == bold:
+            segments[-1][0] += text
+        else:
+            segments.append([text, bold])
+    return ''.join(f"**{text.strip()}**" if bold and text.strip() else text for text, bold in segments)
+
+
+def iter_docx_lines(path):
+    """Yield the text lines of a .docx one paragraph at a time."""
+    with zipfile.ZipFile(path) as docx, docx.open('word/document.xml') as xml:
+        for _, paragraph in etree.iterparse(xml, events=('end',), tag=_W_P):
+            yield from _docx_paragraph_text(paragraph).split('\n')
+            _release(paragraph)
+
+
+def _release_block(element):
+    """Free an HTML block that has been emitted, keeping the text around it.
+
+    Unlike _release, the enclosing block still has to emit the text that
+    follows each nested block (its tail), which is only complete once the
+    next sibling has ended. So the previous sibling, if it is an emitted
+    block, is dropped now and its tail moved onto whatever came before it.
+    """
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    previous = element.getprevious()
+    if parent is None or previous is None or previous.tag not in HTML_BLOCK_TAGS:
+        return
+    tail = previous.tail
+    if tail and tail.strip():
+        before = previous.getprevious()
+        if before is None:
+            parent.text = (parent.text or '') + '\n' + tail
+        else:
+            before.tail = (before.tail or '') + '\n' + tail
+    parent.remove(previous)
+
+
+def _html_block_text(element):
+    """Text of a block, without the nested blocks (already emitted) but with what follows them."""
+    for block in element.iterdescendants(*HTML_BLOCK_TAGS):
+        block.tail = '\n' + (block.tail or '')
+    for br in element.iter('br'):
+        br.tail = '\n' + (br.tail or '')
+    for bold in element.iter('b', 'strong'):
+        bold.text = '**' + (bold.text or '')
+        bold.tail = '**' + (bold.tail or '')
+    return ''.join(element.itertext())
+
+
+def iter_html_lines(source):
+    """Yield the text lines of an HTML file (path or binary file object) one block at a time."""
+    # Nested blocks (e.g. <div><p>) end first, so each block's text is emitted once, in order
+    for _, element in etree.iterparse(source, events=('end',), tag=HTML_BLOCK_TAGS, html=True):
+        for line in _html_block_text(element).split('\n'):
+            yield ' '.join(line.split())
+        _release_block(element)
+
+
+def iter_docx_records(path):
+    return parse_quiz_blocks(iter_docx_lines(path))
+
+
+def iter_html_records(source):
+    return parse_quiz_blocks(iter_html_lines(source))
+
+
+def iter_document_records(path):
+    """Yield MCQRecords from a .docx or .html/.htm file, picked by extension."""
+    if path.lower().endswith('.docx'):
+        return iter_docx_records(path)
+    return iter_html_records(path)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Memory-mapped scanning and offset indexing of large Anki exports.
+
+scan_export() maps the export and finds newlines, tabs and `<br>`
+separators with NumPy comparisons over the raw bytes, one chunk at a time,
+so a multi-GB export is validated without decoding its lines into Python
+strings. A row is valid when it has exactly one tab and at least five
+non-blank `<br>`-separated parts before it, after trimming, the same rule
+parse_mcq_record applies (whether the answer matches an option is left to
+--check, which has to decode the text). Rows are numbered as
+read_export_lines yields them, so index rows and parser rows line up.
+
+The resulting ExportIndex holds the byte offset and line number of every
+content row. Saved next to the export, it lets later runs read just a
+range of rows, or split an export across workers by byte offset.
+"""
+import io
+import mmap
+import os
+
+import numpy as np
+
+from anki_mcq_converter import parse_mcq_record, read_export_lines
+
+# Bytes str.strip() treats as whitespace (ASCII only; the scan never decodes)
+_BLANK = np.zeros(256, bool)
+_BLANK[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+_NL, _CR, _TAB, _LT, _B, _R, _GT, _HASH = b'\n\r\t<br>#'
+# UTF-8 encodings of the non-ASCII whitespace str.strip() also removes (U+0085,
+# U+00A0, U+2000-U+200A, ...), packed big-endian into three bytes
+_WIDE_BLANKS = [chr(c).encode('utf-8') for c in range(0x80, 0x3001) if chr(c).isspace()]
+_WIDE_BLANK_KEYS = np.array([int.from_bytes(b.ljust(3, b'\0'), 'big') for b in _WIDE_BLANKS if len(b) == 3])
+_WIDE_BLANK_PAIRS = np.array([int.from_bytes(b + b'\0', 'big') for b in _WIDE_BLANKS if len(b) == 2])
+_WIDE_BLANK_LEAD = np.zeros(256, bool)
+_WIDE_BLANK_LEAD[[b[0] for b in _WIDE_BLANKS]] = True
+_WIDE_MIN_LEAD = min(b[0] for b in _WIDE_BLANKS)
+
+def default_index_path(export_path):
+    return export_path + '.index.npz'
+
+
+def _wide_blank_positions(a):
+    """Start offsets of non-ASCII whitespace characters in `a`."""
+    n = len(a)
+    # Like _BLANK above: filter the high bytes first, then look them up
+    high = np.flatnonzero(a >= _WIDE_MIN_LEAD)
+    pos = high[_WIDE_BLANK_LEAD[a[high]]]
+    if not pos.size:
+        return pos
+    # A sequence cut off at the end of the chunk reads the last byte again, which never matches
+    key = ((a[pos].astype(np.int64) << 16) | (a[np.minimum(pos + 1, n - 1)].astype(np.int64) << 8)
+           | a[np.minimum(pos + 2, n - 1)])
+    hit = np.isin(key, _WIDE_BLANK_KEYS) | np.isin(key & 0xFFFF00, _WIDE_BLANK_PAIRS)
+    return pos[hit]
+
+
+def _scan_chunk(a, first_line):
+    """Return (row starts, line numbers, valid flags, line count) for the content rows in `a`.
+
+    `a` is a uint8 view of whole lines; offsets are relative to its start.
+    Rows are split, trimmed and classified the way read_export_lines and
+    parse_mcq_record would, without decoding: lines end at LF, CRLF or a
+    lone CR (universal newlines), and only the ASCII whitespace in _BLANK
+    is trimmed. The rare rows holding non-ASCII whitespace are decoded and
+    classified by the parser itself.
+    """
+    n = len(a)
+    newlines = np.flatnonzero(a == _NL)
+    crs = np.flatnonzero(a == _CR)
+    lone_crs = crs[a[np.minimum(crs + 1, n - 1)] != _NL]
+    if lone_crs.size:
+        newlines = np.union1d(newlines, lone_crs)
+    row_ends = newlines if newlines.size and newlines[-1] == n - 1 else np.append(newlines, n)
+    row_starts = np.concatenate(([0], newlines[:len(row_ends) - 1] + 1))
+
+    # <br> is four bytes, so look for '<' and check the three that follow
+    lt = np.flatnonzero(a[:n - 3] == _LT) if n > 3 else np.empty(0, np.int64)
+    brs = lt[(a[lt + 1] == _B) & (a[lt + 2] == _R) & (a[lt + 3] == _GT)]
+
+    # Every whitespace byte is <= 32, so only those positions need the table lookup
+    low = np.flatnonzero(a <= 32)
+    blanks = low[_BLANK[a[low]]]
+
+    def filled(starts, ends):
+        """Whether each [start, end) span has a non-blank byte."""
+        return ends - starts > np.searchsorted(blanks, ends) - np.searchsorted(blanks, starts)
+
+    # Each row is stripped before it is split, so trim the blank runs at both ends
+    if blanks.size:
+        breaks = np.flatnonzero(np.diff(blanks) != 1) + 1
+        run_first = np.concatenate(([0], breaks))
+        run_last = np.concatenate((breaks - 1, [len(blanks) - 1]))
+        j = np.searchsorted(blanks, row_starts)
+        k = np.minimum(j, len(blanks) - 1)
+        run = np.searchsorted(run_first, k, 'right') - 1
+        starts = np.where(blanks[k] == row_starts, blanks[run_last[run]] + 1, row_starts)
+        k = np.maximum(np.searchsorted(blanks, row_ends) - 1, 0)
+        run = np.searchsorted(run_first, k, 'right') - 1
+        ends = np.where(blanks[k] == row_ends - 1, blanks[run_first[run]], row_ends)
+        # An all-blank row trims to an empty span at its end
+        starts = np.minimum(starts, row_ends)
+        ends = np.maximum(ends, starts)
+    else:
+        starts, ends = row_starts, row_ends
+
+    tabs = np.flatnonzero(a == _TAB)
+    first_tab = np.searchsorted(tabs, starts)
+    tab_counts = np.searchsorted(tabs, ends) - first_tab
+    if tabs.size:
+        question_ends = np.where(tab_counts > 0, tabs[np.minimum(first_tab, len(tabs) - 1)], ends)
+    else:
+        question_ends = ends
+
+    # Only separators inside a row's question part count
+    br_rows = np.searchsorted(row_starts, brs, 'right') - 1
+    brs = brs[brs + 4 <= question_ends[br_rows]]
+    # Part i of a row runs from the end of separator i-1 to the start of separator i
+    part_starts = np.sort(np.concatenate((starts, brs + 4)), kind='stable')
+    part_ends = np.sort(np.concatenate((question_ends, brs)), kind='stable')
+    part_rows = np.searchsorted(row_starts, part_starts, 'right') - 1
+    parts = np.bincount(part_rows, weights=filled(part_starts, part_ends), minlength=len(row_starts))
+
+    # read_export_lines skips '#' headers and blank lines
+    header = a[np.minimum(row_starts, n - 1)] == _HASH
+    keep = (ends > starts) & ~header
+    valid = (tab_counts == 1) & (parts >= 5)
+
+    wide = _wide_blank_positions(a)
+    if wide.size:
+        for row in np.unique(np.searchsorted(row_starts, wide, 'right') - 1).tolist():
+            text = bytes(a[row_starts[row]:row_ends[row]]).decode('utf-8', 'replace')
+            line = text.strip()
+            keep[row] = bool(line) and not text.startswith('#')
+            valid[row] = parse_mcq_record(line) is not None
+
+    lines = first_line + np.arange(len(row_starts), dtype=np.int64)
+    return row_starts[keep], lines[keep], valid[keep], len(row_starts)
+
+
+class _ByteRange(io.RawIOBase):
+    """Raw reader over bytes [begin, end) of a file."""
+
+    def __init__(self, path, begin, end):
+        self._file = open(path, 'rb', buffering=0)
+        self._file.seek(begin)
+        self._left = end - begin
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._left:
+            return 0
+        count = self._file.readinto(memoryview(buffer)[:self._left])
+        self._left -= count
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class ExportIndex:
+    """Byte offsets, line numbers and validity of an export's content rows."""
+
+    def __init__(self, offsets, lines, valid, size, mtime_ns):
+        self.offsets = offsets
+        self.lines = lines
+        self.valid = valid
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def valid_count(self):
+        return int(self.valid.sum())
+
+    def malformed_lines(self):
+        """1-based line numbers of rows parse_mcq_record would reject."""
+        return self.lines[~self.valid].tolist()
+
+    def is_current(self, export_path):
+        st = os.stat(export_path)
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, offsets=self.offsets, lines=self.lines, valid=self.valid,
+                     meta=np.array([self.size, self.mtime_ns], np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            size, mtime_ns = data['meta'].tolist()
+            return cls(data['offsets'], data['lines'], data['valid'], size, mtime_ns)
+
+    def byte_range(self, start=0, stop=None):
+        """Byte offsets (begin, end) covering rows[start:stop]."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return self.size, self.size
+        end = self.offsets[stop] if stop < len(self) else self.size
+        return int(self.offsets[start]), int(end)
+
+    def split(self, parts):
+        """Cut the rows into up to `parts` (start, stop) ranges of about equal bytes."""
+        if not len(self):
+            return []
+        targets = np.linspace(self.offsets[0], self.size, parts + 1)[1:-1]
+        cuts = np.unique(np.concatenate(([0], np.searchsorted(self.offsets, targets), [len(self)])))
+        return [(int(start), int(stop)) for start, stop in zip(cuts[:-1], cuts[1:])]
+
+    def open_rows(self, export_path, start=0, stop=None):
+        """Return a text file object over rows[start:stop] only.
+
+        The result can be passed to MCQConverter.convert_file or
+        read_export_lines like any other export file object.
+        """
+        begin, end = self.byte_range(start, stop)
+        # Streamed, so a large range is never decoded into memory at once
+        return io.TextIOWrapper(io.BufferedReader(_ByteRange(export_path, begin, end)), encoding='utf-8')
+
+    def iter_lines(self, export_path, start=0, stop=None):
+        """Yield the content lines of rows[start:stop]."""
+        with self.open_rows(export_path, start, stop) as f:
+            yield from read_export_lines(f)
+
+
+def scan_export(path, chunk_size=4 << 20):
+    """Scan an export through mmap and return its ExportIndex."""
+    st = os.stat(path)
+    offsets, lines, valid = [], [], []
+    with open(path, 'rb') as f:
+        if st.st_size == 0:
+            empty = np.empty(0, np.int64)
+            return ExportIndex(empty, empty, np.empty(0, bool), 0, st.st_mtime_ns)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos, line = 0, 1
+            while pos < st.st_size:
+                # Extend each chunk to the end of its last line
+                end = mm.find(b'\n', min(pos + chunk_size, st.st_size) - 1)
+                end = st.st_size if end < 0 else end + 1
+                a = np.frombuffer(mm, np.uint8, end - pos, pos)
+                chunk_offsets, chunk_lines, chunk_valid, rows = _scan_chunk(a, line)
+                offsets.append(chunk_offsets + pos)
+                lines.append(chunk_lines)
+                valid.append(chunk_valid)
+                del a  # the mmap cannot close while a view is alive
+                pos, line = end, line + rows
+    return ExportIndex(np.concatenate(offsets), np.concatenate(lines), np.concatenate(valid),
+                       st.st_size, st.st_mtime_ns)
+
+
+def load_or_scan(path, index_path=None):
+    """Load the saved index for `path` if it is up to date, otherwise scan and save a new one."""
+    index_path = index_path or default_index_path(path)
+    if os.path.exists(index_path):
+        index = ExportIndex.load(index_path)
+        if index.is_current(path):
+            return index
+    index = scan_export(path)
+    index.save(index_path)
+    return index
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""OCR ingestion of scanned quiz pages.
+
+Pages are loaded and preprocessed (binarize, deskew, crop) with OpenCV and
+NumPy, then read with Tesseract. Work is split into batches of pages that
+are fanned out across a process pool; the recognized text is returned in
+page order and can be fed to anki_mcq_converter.parse_quiz_blocks.
+
+Requires numpy, opencv-python-headless, pytesseract and a tesseract binary
+on PATH (see requirements.txt).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pytesseract
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+# Tesseract treats the page as one uniform block of text
+TESSERACT_CONFIG = '--psm 6'
+
+
+def binarize(gray):
+    """Otsu-threshold a grayscale page so text pixels are 255 on 0."""
+    blurred = cv2.GaussianBlur(gray, (3, 3), 0)
+    _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return binary
+
+
+def skew_angle(binary):
+    """Estimate the text skew in degrees from the minimum-area rectangle of all ink."""
+    ys, xs = np.nonzero(binary)
+    if len(xs) < 2:
+        return 0.0
+    points = np.column_stack((xs, ys)).astype(np.float32)
+    angle = cv2.minAreaRect(points)[-1]
+    # OpenCV reports angles in [0, 90); map to the nearest rotation from horizontal
+    if angle > 45:
+        angle -= 90
+    return float(angle)
+
+
+def deskew(binary):
+    angle = skew_angle(binary)
+    if abs(angle) < 0.1:
+        return binary
+    h, w = binary.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+
+
+def crop(binary, margin=10):
+    """Crop to the bounding box of the ink plus a margin."""
+    rows = np.flatnonzero(binary.any(axis=1))
+    cols = np.flatnonzero(binary.any(axis=0))
+    if not len(rows):
+        return binary
+    h, w = binary.shape
+    return binary[max(rows[0] - margin, 0):min(rows[-1] + margin + 1, h),
+                  max(cols[0] - margin, 0):min(cols[-1] + margin + 1, w)]
+
+
+def preprocess(gray):
+    """Binarize, deskew and crop a grayscale page; returns black text on white."""
+    return cv2.bitwise_not(crop(deskew(binarize(gray))))
+
+
+def ocr_batch(paths):
+    """Preprocess and OCR a batch of page images (process pool worker)."""
+    texts = []
+    for path in paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"cannot read image {path}")
+        texts.append(pytesseract.image_to_string(preprocess(gray), config=TESSERACT_CONFIG))
+    return texts
+
+
+def ocr_pages(paths, workers=None, batch_size=4):
+    """OCR page images in parallel and return their text in input order."""
+    # Fail here with a clear error: pytesseract's exceptions do not survive
+    # the trip back from a worker process
+    pytesseract.get_tesseract_version()
+    paths = list(paths)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    # One tesseract thread per worker; the pool provides the parallelism
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return [text for texts in pool.map(ocr_batch, batches) for text in texts]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""CPU and memory profiling for anki_mcq_converter's --profile options.
+
+profile_call() runs a function under either a stack sampler or cProfile
+and writes the result as collapsed stacks, one "outer;...;inner value"
+line per distinct stack, the input format of flamegraph.pl, inferno and
+speedscope. Sampled values are sample counts; cProfile values are
+microseconds of own time, attributed to call paths in proportion to
+each caller's share of the callee's time (cProfile only records
+caller/callee pairs, not whole stacks).
+
+MemoryProfiler is a ConversionStats step hook that snapshots tracemalloc
+at the end of every convert and write step and lists the allocation
+sites that grew the most during it.
+
+Nothing here is imported unless one of the options is given, so normal
+runs pay nothing for it.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval from a background thread."""
+
+    def __init__(self, interval=0.001, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        current_frames, thread_id, samples = sys._current_frames, self.thread_id, self.samples
+        while not self._stop.wait(self.interval):
+            frame = current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                # Keyed by code objects; labels are only formatted once, at the end
+                samples[tuple(reversed(stack))] += 1
+
+    def __enter__(self):
+        # The sampler only runs when the profiled thread lets go of the GIL
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def collapsed(self):
+        labels = {}
+        stacks = Counter()
+        for codes, count in self.samples.items():
+            names = [labels.get(code) or labels.setdefault(code, _frame_label(code)) for code in codes]
+            stacks[';'.join(names)] += count
+        return stacks
+
+
+def _pstats_label(func):
+    filename, lineno, name = func
+    if filename == '~':
+        return name  # built-in, e.g. "<method 'split' of 'str' objects>"
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapse_pstats(stats, min_seconds=1e-6):
+    """Turn pstats.Stats into collapsed stacks with microsecond values."""
+    entries = stats.stats
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    stacks = Counter()
+
+    def walk(func, path, on_path, share):
+        _, _, own, total, _ = entries[func]
+        path = path + (_pstats_label(func),)
+        if own * share >= min_seconds:
+            stacks[';'.join(path)] += int(own * share * 1e6)
+        for callee, edge_total in callees.get(func, ()):
+            callee_total = entries[callee][3]
+            # Recursion would loop forever; its time is already in the outer frame
+            if callee in on_path or not callee_total:
+                continue
+            callee_share = share * edge_total / callee_total
+            if callee_share * callee_total >= min_seconds:
+                walk(callee, path, on_path | {callee}, callee_share)
+
+    for func, entry in entries.items():
+        if not entry[4]:
+            walk(func, (), frozenset([func]), 1.0)
+    return stacks
+
+
+def write_collapsed(stacks, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, value in sorted(stacks.items()):
+            if value:
+                f.write(f"{stack} {value}\n")
+
+
+def profile_call(fn, path, mode='sample', *args, **kwargs):
+    """Call fn(*args, **kwargs) under a profiler and write collapsed stacks to `path`.
+
+    The stacks are written even if fn raises or exits, e.g. through
+    sys.exit() after --check.
+    """
+    start = time.perf_counter()
+    if mode == 'cprofile':
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            stacks = collapse_pstats(pstats.Stats(profiler))
+            write_collapsed(stacks, path)
+            print(f"Profile: {time.perf_counter() - start:.2f} s traced with cProfile, "
+                  f"{len(stacks)} stacks (microseconds) written to {path}", file=sys.stderr)
+
+    sampler = StackSampler()
+    try:
+        with sampler:
+            return fn(*args, **kwargs)
+    finally:
+        stacks = sampler.collapsed()
+        write_collapsed(stacks, path)
+        print(f"Profile: {sum(stacks.values())} samples over {time.perf_counter() - start:.2f} s, "
+              f"{len(stacks)} stacks written to {path}", file=sys.stderr)
+
+
+class MemoryProfiler:
+    """Record the top allocation sites of each conversion step with tracemalloc.
+
+    Pass snapshot as a ConversionStats step hook. Tracing starts when the
+    profiler is created, so the first step includes everything allocated
+    since then.
+    """
+
+    def __init__(self, top=10, frames=1):
+        import tracemalloc
+
+        self.top = top
+        self.steps = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._last = self._take_snapshot()
+
+    @staticmethod
+    def _take_snapshot():
+        import tracemalloc
+
+        # Leave out the snapshots the profiler itself keeps, and import machinery
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+
+    def snapshot(self, stages):
+        import tracemalloc
+
+        current = self._take_snapshot()
+        diff = current.compare_to(self._last, 'lineno')
+        current_size, peak = tracemalloc.get_traced_memory()
+        self.steps.append(('+'.join(stages), current_size, peak, diff[:self.top]))
+        tracemalloc.reset_peak()
+        self._last = current
+
+    def format(self):
+        lines = []
+        for label, current, peak, diff in self.steps:
+            lines.append(f"memory after {label}: {current / 1e6:.1f} MB traced, peak {peak / 1e6:.1f} MB")
+            for stat in diff:
+                frame = stat.traceback[0]
+                lines.append(f"  {stat.size_diff / 1e6:+9.2f} MB {stat.count_diff:+9d} blocks  "
+                             f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        return '\n'.join(lines)